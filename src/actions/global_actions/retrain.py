@@ -6,8 +6,9 @@ from src.loaders.asnr_dataloader import ASNRGraph
 from src.models.train import train_model
 
 from ..action import GlobalAction
-from ...static import PageState, GRAPH_VERSION_FOLDER, VERSIONS
+from ...static import PageState, GRAPH_VERSION_FOLDER, CATALOG, MANIFESTS
 from ..stack import ActionStack
+from ...storage.versions import VERSION_STORE
 from ...gui.action_forms.notification import notify_user
 
 logging.basicConfig(level=logging.INFO)
@@ -25,19 +26,22 @@ class Retrain(GlobalAction):
         # Determine next version id
         graph_folder = os.path.join(GRAPH_VERSION_FOLDER, str(PageState.id))
         os.makedirs(graph_folder, exist_ok=True)
-        next_version = f"v{len(os.listdir(graph_folder))}"
+        next_version = VERSION_STORE.next_version(str(PageState.id))
 
         # Retraining graph
-        features, edgelist, adj, _, _ = ASNRGraph(graph_obj=self.graph_gui.graph.graph).preprocess()
+        asnr = ASNRGraph(graph_obj=self.graph_gui.graph.graph)
+        features, edgelist, adj, _, _ = asnr.preprocess()
         try:
-            train_model(PageState.id, next_version, features, edgelist, adj)
+            train_model(PageState.id, next_version, features, edgelist, adj, asnr.feature_encoder)
         except:
             return False
 
         logger.info("Graph retrained")
 
         # Increasing current version number
-        VERSIONS[PageState.id].append(next_version)
+        CATALOG.add_version(PageState.id, next_version)
+        MANIFESTS[PageState.id].record(next_version, {"prev_version": PageState.version,
+                                                      "prev_path": PageState.version_path})
         PageState.step_version(next_version)
         PageState.landing_page.update_version_dropdown()
 
@@ -1,10 +1,9 @@
 import logging
-import os
-import pickle
 
 from ..action import GlobalAction
-from ...static import PageState, GRAPH_VERSION_FOLDER, VERSIONS
+from ...static import PageState, GRAPH_VERSION_FOLDER, CATALOG
 from ...graph import Graph
+from ...storage.versions import VERSION_STORE
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("save.action")
@@ -17,8 +16,8 @@ class Save(GlobalAction):
         self.graph = graph
 
     def do(self):
-        filepath = PageState.version_path
-        os.makedirs(os.path.split(filepath)[0], exist_ok=True)
-        with open(filepath, "wb") as f:
-            pickle.dump(self.graph.state_dict, f)
+        # Note: a version opened from a pickle of an older release is saved as vN.npz
+        filepath = VERSION_STORE.save(PageState.version_path, self.graph.state_dict)
+        PageState.version_path = filepath
+        CATALOG.add_version(PageState.id, PageState.version)
         logger.info(f"Graph saved to {filepath}")
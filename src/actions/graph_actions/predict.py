@@ -40,7 +40,8 @@ class Predict(GraphAction):
                     get_pred_edges(self.graph_gui.graph.graph,
                                    PageState.id,
                                    PageState.version,
-                                   node_name))
+                                   node_name,
+                                   self.graph_gui.graph.model_inputs))
             except Exception as e:
                 print(f"Exception occurred: {e}")
                 traceback.print_exc()
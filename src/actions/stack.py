@@ -18,7 +18,9 @@ class _ActionStack(QObject):
     @staticmethod
     def add(item):
         assert isinstance(item, GraphAction), f"Action must be GraphAction, not {type(item)}"
-        success = item.do()
+        # Note: compound actions (e.g. predict) redraw the page once, when the batch exits
+        with item.graph_gui.batch():
+            success = item.do()
         success = success is None or success
         if success:
             ActionStack.done_stack.append(item)
@@ -30,7 +32,8 @@ class _ActionStack(QObject):
     def undo():
         item = ActionStack.done_stack.pop()
         ActionStack.undone_stack.append(item)
-        item.undo()
+        with item.graph_gui.batch():
+            item.undo()
         ActionStack.trigger_events()
 
     @staticmethod
@@ -38,7 +41,8 @@ class _ActionStack(QObject):
         if len(ActionStack.undone_stack):
             item = ActionStack.undone_stack.pop()
             ActionStack.done_stack.append(item)
-            item.do()
+            with item.graph_gui.batch():
+                item.do()
             ActionStack.trigger_events()
 
     @staticmethod
@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import logging
+import numpy as np
+import networkx as nx
+
+from .graph import Graph
+from .metrics import MetricEngine
+from .storage.csr import CSRCore
+from .storage.versions import VERSION_STORE
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('csr_graph')
+
+
+class CSRGraph(Graph):
+    """
+    Graph backed by a CSRCore instead of a networkx dict-of-dicts.
+
+    It has the public API of Graph. Node, degree and adjacency queries are answered from
+    the arrays; `graph` materializes a networkx graph only when an algorithm needs one
+    (metrics, drawing, saving) and keeps it in sync with later edits.
+    Only simple undirected graphs are supported.
+
+    Note: node data returned by `nodes` / `features` are copies, editing them has no effect.
+    """
+
+    def _init_backend(self, graph):
+        self.core = graph if isinstance(graph, CSRCore) else CSRCore.from_networkx(graph)
+        self._graph = None
+        self._metric_engine = None
+
+    @classmethod
+    def from_pkl(cls, filepath) -> CSRGraph:
+        columns = VERSION_STORE.snapshot(filepath)
+        if columns is None:
+            return super().from_pkl(filepath)
+        logger.info(f"Opening columnar graph {filepath}")
+        return cls.from_state_dict({
+            "graph": CSRCore.from_columnar(columns),
+            "node_layout": columns.node_layout(),
+            "prev_version": columns.meta["prev_version"],
+            "prev_path": columns.meta["prev_path"],
+        })
+
+    @property
+    def graph(self) -> nx.Graph:
+        if self._graph is None:
+            logger.info("Materializing networkx view of the CSR graph.")
+            self._graph = self.core.to_networkx()
+        return self._graph
+
+    @property
+    def metric_engine(self) -> MetricEngine:
+        if self._metric_engine is None:
+            self._metric_engine = MetricEngine(self.graph)
+        return self._metric_engine
+
+    def _invalidate(self):
+        if self._metric_engine is not None:
+            self._metric_engine.invalidate()
+
+    # =====================================================
+    # Queries answered by the arrays
+    # =====================================================
+
+    @property
+    def nodes(self):
+        return _NodeView(self.core)
+
+    @property
+    def n_nodes(self):
+        return self.core.n_nodes
+
+    @property
+    def directed_edges(self):
+        names = self.core.names
+        return [(names[u], names[v]) for u, v in zip(self.core.src.tolist(), self.core.dst.tolist())]
+
+    @property
+    def undirected_edges(self):
+        names = self.core.names
+        keys = [set() for _ in range(self.core.n_edges)]
+        for key, (_, present) in self.core.edge_columns.items():
+            for e in np.flatnonzero(present).tolist():
+                keys[e].add(key)
+        return {(names[u], names[v]): keys[e]
+                for e, (u, v) in enumerate(zip(self.core.src.tolist(), self.core.dst.tolist()))}
+
+    @property
+    def degree_array(self) -> np.ndarray:
+        return self.core.degrees()
+
+    @property
+    def degrees(self):
+        return dict(zip(self.core.names, self.degree_array.tolist()))
+
+    @property
+    def avg_degree(self):
+        return float(self.degree_array.mean())
+
+    @property
+    def min_degree(self):
+        return int(self.degree_array.min())
+
+    @property
+    def max_degree(self):
+        return int(self.degree_array.max())
+
+    @property
+    def avg_coeff(self):
+        loops = np.bincount(self.core.src[self.core.src == self.core.dst], minlength=self.core.n_nodes)
+        degrees = np.diff(self.core.indptr) - loops
+        triangles = self.core.triangles()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            coeffs = np.where(triangles > 0, 2 * triangles / (degrees * (degrees - 1)), 0)
+        return round(float(coeffs.mean()), 6)
+
+    def neighbors(self, node):
+        names = self.core.names
+        return [names[j] for j in self.core.neighbors(self.core.index[node]).tolist()]
+
+    def ego_nodes(self, node, k=1):
+        return [self.core.names[i] for i in self.core.ego(self.core.index[node], k).tolist()]
+
+    def ego(self, node, k=1) -> nx.Graph:
+        return self.core.subgraph(self.core.ego(self.core.index[node], k))
+
+    # =====================================================
+    # Edits
+    # =====================================================
+
+    def _insert_nodes(self, nodes):
+        for node in nodes:
+            name, data = node if isinstance(node, tuple) else (node, {})
+            self.core.add_node(name, data)
+        if self._graph is not None:
+            self.metric_engine.add_nodes_from(nodes)
+
+    def _insert_edges(self, edges):
+        for edge in edges:
+            for node in edge[:2]:
+                if node not in self.core.index:
+                    self.core.add_node(node, {})
+        self.core.add_edges([(edge[0], edge[1], edge[2] if len(edge) > 2 else {}) for edge in edges])
+        if self._graph is not None:
+            self.metric_engine.add_edges_from(edges)
+
+    def _delete_nodes(self, nodes):
+        for node in nodes:
+            if node in self.core.index:
+                self.core.remove_node(node)
+        if self._graph is not None:
+            self.metric_engine.remove_nodes_from(nodes)
+
+    def _delete_edges(self, edges):
+        for edge in edges:
+            if edge[0] in self.core.index and edge[1] in self.core.index:
+                self.core.remove_edge(edge[0], edge[1])
+        if self._graph is not None:
+            self.metric_engine.remove_edges_from(edges)
+
+    def clean_empty_nodes(self):
+        empty = [self.core.names[i] for i in range(self.core.n_nodes) if not self.core.node_data(i)]
+        self._delete_nodes(empty)
+        if empty and self._metric_engine is not None:
+            self._metric_engine.invalidate()
+        return self.graph if self._graph is not None else None
+
+
+class _NodeView:
+    """Read-only view of the node table, iterates like networkx' G.nodes(data=True)"""
+
+    def __init__(self, core: CSRCore):
+        self.core = core
+
+    def __len__(self):
+        return self.core.n_nodes
+
+    def __iter__(self):
+        for i, name in enumerate(self.core.names):
+            yield name, self.core.node_data(i)
+
+    def __contains__(self, name):
+        return name in self.core.index
+
+    def __getitem__(self, name):
+        return self.core.node_data(self.core.index[name])
+
+
+if __name__ == "__main__":
+    # Benchmark against the networkx backed graph on a synthetic colony
+    import os
+    import time
+    import tracemalloc
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    logging.disable(logging.INFO)
+
+    def synthetic_graph(n_nodes=20000, n_edges=60000, seed=42):
+        rng = np.random.default_rng(seed)
+        g = nx.gnm_random_graph(n_nodes, n_edges, seed=seed)
+        g = nx.relabel_nodes(g, {i: f"animal_{i}" for i in g})
+        for i, node in enumerate(g):
+            g.nodes[node].update(sex=str(rng.choice(["M", "F"])), age=float(i % 13), group=str(i % 7))
+        for u, v in g.edges:
+            g.edges[u, v]["weight"] = float(rng.integers(1, 10))
+        return g
+
+    def measure(build):
+        tracemalloc.start()
+        start = time.perf_counter()
+        obj = build()
+        elapsed = time.perf_counter() - start
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return obj, elapsed, size
+
+    def timeit(func, repeat=20):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return (time.perf_counter() - start) / repeat
+
+    source = synthetic_graph()
+    nx_graph, nx_time, nx_size = measure(lambda: source.copy())
+    core, csr_time, csr_size = measure(lambda: CSRCore.from_networkx(source))
+    print(f"storage: networkx {nx_size / 1e6:.1f} MB, csr {csr_size / 1e6:.1f} MB")
+
+    nodes = list(source)[:1000]
+    print(f"degrees:    networkx {timeit(lambda: dict(nx_graph.degree())) * 1e3:.2f} ms, "
+          f"csr {timeit(core.degrees) * 1e3:.2f} ms")
+    print(f"neighbors:  networkx {timeit(lambda: [list(nx_graph[n]) for n in nodes]) * 1e3:.2f} ms, "
+          f"csr {timeit(lambda: [core.neighbors(core.index[n]) for n in nodes]) * 1e3:.2f} ms "
+          f"(1000 nodes)")
+    print(f"adjacency:  networkx {timeit(lambda: nx.adjacency_matrix(nx_graph), 3) * 1e3:.2f} ms, "
+          f"csr {timeit(core.adjacency, 3) * 1e3:.2f} ms")
+    csr_graph = CSRGraph(source)
+    nx_backed = Graph(source.copy())
+    print(f"edges_of:   Graph {timeit(lambda: nx_backed.edges_of(nodes[0]), 3) * 1e3:.2f} ms, "
+          f"CSRGraph {timeit(lambda: csr_graph.edges_of(nodes[0])) * 1e3:.3f} ms")
+    print(f"avg_degree: Graph {timeit(lambda: nx_backed.avg_degree, 3) * 1e3:.2f} ms, "
+          f"CSRGraph {timeit(lambda: csr_graph.avg_degree) * 1e3:.3f} ms")
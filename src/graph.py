@@ -2,11 +2,16 @@ from __future__ import annotations
 
 import os
 import logging
-import pickle
 import networkx as nx
+from contextlib import contextmanager
 from PyQt6.QtCore import QObject, pyqtSignal
 
 from .static import PageState
+from .metrics import MetricEngine
+from .node_records import NodeRecords
+from .diff import GraphDelta, graph_delta
+from .models.gae_inputs import GAEInputs
+from .storage.versions import VERSION_STORE
 from src.loaders.asnr_dataloader import ASNRGraph
 
 logging.basicConfig(level=logging.INFO)
@@ -25,7 +30,11 @@ class Graph(QObject):
 
     def __init__(self, graph: nx.Graph):
         super().__init__()
-        self.graph = graph
+        self._batch_depth = 0
+        self._pending_signals = []
+        self._init_backend(graph)
+        self._model_inputs = None
+        self.graph_updated.connect(self._invalidate)
         self.deselect()
         self.clean_empty_nodes()
         self._selected_nodes = []
@@ -33,6 +42,12 @@ class Graph(QObject):
         self.fresh_nodes = []
         self.node_layout = None
 
+    def _init_backend(self, graph):
+        """Store the graph, overridden by other graph backends"""
+        self.graph = graph
+        # Note: edits go through the engine, which keeps derived metrics up to date
+        self.metric_engine = MetricEngine(self.graph)
+
     @classmethod
     def from_graphml(cls, filepath) -> Graph:
         logger.info(f"Reading graph {filepath}")
@@ -52,9 +67,8 @@ class Graph(QObject):
     @classmethod
     def from_pkl(cls, filepath) -> Graph:
         logger.info(f"Reading graph {filepath}")
-        with open(filepath, "rb") as f:
-            state_dict = pickle.load(f)
-        return cls.from_state_dict(state_dict)
+        # Note: versions may be stored as deltas, the store replays them from the last snapshot
+        return cls.from_state_dict(VERSION_STORE.load(filepath))
 
     @classmethod
     def from_page_info(cls) -> Graph:
@@ -69,12 +83,20 @@ class Graph(QObject):
 
     @property
     def centrality_dict(self) -> dict:
-        return {
-            "betweeness": nx.betweenness_centrality(self.graph),
-            "closeness": nx.closeness_centrality(self.graph),
-            # "eigenvector": nx.eigenvector_centrality(self.graph),
-            "degree": nx.degree_centrality(self.graph)
-        }
+        # Memoized, recomputed only after graph_updated
+        return self.metric_engine.centrality_dict
+
+    @property
+    def fingerprint(self) -> str:
+        # Content hash of the current graph state, key of the analytics cache
+        return self.metric_engine.fingerprint
+
+    @property
+    def model_inputs(self) -> GAEInputs:
+        # Inputs of the link prediction model, patched by the edits below
+        if self._model_inputs is None:
+            self._model_inputs = GAEInputs(self.graph)
+        return self._model_inputs
 
     @property
     def selected_nodes(self):
@@ -97,17 +119,22 @@ class Graph(QObject):
     @selected_nodes.setter
     def selected_nodes(self, value):
         self._selected_nodes = value
-        self.node_selection_changed.emit(self._selected_nodes)
+        self._emit("node_selection_changed")
 
     @selected_directed_edges.setter
     def selected_directed_edges(self, value):
         self._selected_directed_edges = value
-        self.edge_selection_changed.emit(self._selected_directed_edges)
+        self._emit("edge_selection_changed")
 
     @property
     def metrics(self) -> dict:
         return self.centrality_dict
 
+    @property
+    def node_records(self) -> NodeRecords:
+        # Memoized like the metrics, rebuilt only after the graph changed
+        return self.metric_engine.get("node_records", lambda: NodeRecords(self.nodes, self.metrics))
+
     @property
     def nodes(self) -> dict:
         return self.graph.nodes(data=True)
@@ -130,7 +157,7 @@ class Graph(QObject):
 
     @property
     def degrees(self):
-        return dict(self.graph.degree())
+        return self.metric_engine.degrees
 
     @property
     def avg_degree(self):
@@ -173,7 +200,7 @@ class Graph(QObject):
 
     @property
     def avg_coeff(self):
-        return round(nx.average_clustering(G=self.graph), 6)
+        return round(self.metric_engine.avg_clustering, 6)
 
     # =====================================================
     # Add / remove nodes
@@ -182,19 +209,21 @@ class Graph(QObject):
     # Add
 
     def add_nodes(self, nodes):
-        self.graph.add_nodes_from(nodes)
+        self._insert_nodes(nodes)
+        self._edited_model_inputs(nodes=[name for name, _ in nodes])
         # Note: append would not work here, because we need to trigger .setter
         self.selected_nodes = self._selected_nodes + [name for name, _ in nodes]
         self.fresh_nodes.extend([name for name, _ in nodes])
         logger.info(f"New nodes. Selected nodes are {self.selected_nodes}")
-        self.graph_updated.emit()
+        self._emit("graph_updated")
 
     def add_edges(self, edges):
-        self.graph.add_edges_from(edges)
+        self._insert_edges(edges)
+        self._edited_model_inputs(edges=edges)
         # Note: append would not work here, because we need to trigger .setter
         self.selected_directed_edges = self._selected_directed_edges + list(edges)
         logger.info(f"New edges. Selected edges are {self.selected_directed_edges}")
-        self.graph_updated.emit()
+        self._emit("graph_updated")
 
     def add_node(self, node):
         self.add_nodes([node])
@@ -206,19 +235,21 @@ class Graph(QObject):
     def remove_nodes(self, nodes=None):
         if nodes is None or nodes[0] is None:
             nodes = self.selected_nodes
-        self.graph.remove_nodes_from(nodes)
+        self._delete_nodes(nodes)
+        self._edited_model_inputs(removed=True)
         self.fresh_nodes = [n for n in self.fresh_nodes if n not in nodes]
         new_selection = [x for x in self.selected_nodes if x not in nodes]
         self.selected_nodes = new_selection
-        self.graph_updated.emit()
+        self._emit("graph_updated")
 
     def remove_edges(self, edges=None):
         if edges is None or edges[0] is None:
             edges = self.selected_directed_edges
-        self.graph.remove_edges_from(self.selected_directed_edges)
+        self._delete_edges(edges)
+        self._edited_model_inputs(edges=edges)
         new_selection = [x for x in self.selected_directed_edges if x not in edges]
         self.selected_directed_edges = new_selection
-        self.graph_updated.emit()
+        self._emit("graph_updated")
 
     def remove_node(self, node=None):
         self.remove_nodes([node])
@@ -226,27 +257,81 @@ class Graph(QObject):
     def remove_edge(self, edge=None):
         self.remove_edges([edge])
 
+    # Structural edits, overridden by other graph backends
+
+    def _insert_nodes(self, nodes):
+        self.metric_engine.add_nodes_from(nodes)
+
+    def _insert_edges(self, edges):
+        self.metric_engine.add_edges_from(edges)
+
+    def _delete_nodes(self, nodes):
+        self.metric_engine.remove_nodes_from(nodes)
+
+    def _delete_edges(self, edges):
+        self.metric_engine.remove_edges_from(edges)
+
+    def _invalidate(self):
+        self.metric_engine.invalidate()
+
+    def _edited_model_inputs(self, nodes=(), edges=(), removed=False):
+        if self._model_inputs is not None:
+            self._model_inputs.edited(nodes, edges, removed)
+
+    # =====================================================
+    # Batches of edits
+    # =====================================================
+
+    @contextmanager
+    def batch(self):
+        """
+        Group several edits: signals are held back and each one is emitted once,
+        when the outermost batch exits.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                pending, self._pending_signals = self._pending_signals, []
+                for signal in pending:
+                    self._send(signal)
+
+    def _emit(self, signal):
+        if not self._batch_depth:
+            self._send(signal)
+            return
+        if signal not in self._pending_signals:
+            self._pending_signals.append(signal)
+        if signal == "graph_updated":
+            # Derived metrics must not go stale inside the batch
+            self._invalidate()
+
+    def _send(self, signal):
+        if signal == "node_selection_changed":
+            self.node_selection_changed.emit(self._selected_nodes)
+        elif signal == "edge_selection_changed":
+            self.edge_selection_changed.emit(self._selected_directed_edges)
+        else:
+            self.graph_updated.emit()
+
     # =====================================================
     # Other utilities
     # =====================================================
 
+    def delta_from(self, other) -> GraphDelta:
+        """Full delta turning other into this graph"""
+        return graph_delta(other.graph, self.graph)
+
     def difference_to(self, other=None):
 
         if other is None:
             return [], []
 
-        this_nodes = set([name for name, _ in self.nodes])
-        other_nodes = set([name for name, _ in other.nodes])
-        new_nodes = list(this_nodes - other_nodes)
-
-        new_edges = set(self.undirected_edges.keys())
-        for edge_name, edge in other.undirected_edges.items():
-            if edge_name in new_edges and edge == self.undirected_edges[edge_name]:
-                # Make sure edge exist with same name and value
-                new_edges.remove(edge_name)
-        new_edges = list(new_edges)
-
-        return new_nodes, new_edges
+        # New nodes, and edges that were added or whose attributes changed (e.g. reweighted)
+        delta = self.delta_from(other)
+        return list(delta.added_nodes), list(delta.added_edges) + list(delta.changed_edges)
 
     def toggle_status_of_node(self, node_name):
         if node_name in self.selected_nodes:
@@ -255,7 +340,7 @@ class Graph(QObject):
         else:
             logger.info(f"Node {node_name} selected.")
             self._selected_nodes.append(node_name)
-        self.node_selection_changed.emit(self._selected_nodes)
+        self._emit("node_selection_changed")
         logger.info(f"Selected nodes: {self.selected_nodes}")
 
     def toggle_status_of_edge(self, edge):
@@ -268,15 +353,32 @@ class Graph(QObject):
         else:
             self._selected_directed_edges.append(edge)
             logger.info(f"Edge {edge} selected.")
-        self.edge_selection_changed.emit(self._selected_directed_edges)
+        self._emit("edge_selection_changed")
         logger.info(f"Selected edges: {self.selected_directed_edges}")
 
+    # Neighbourhood queries, through the adjacency of the node instead of a scan of all edges
+
+    def neighbors(self, node):
+        return list(self.graph.adj[node])
+
     def edges_of(self, node):
-        edges = []
-        for edge in self.graph.edges:
-            if edge[0] == node or edge[1] == node:
-                edges.append(edge)
-        return edges
+        return [(node, neighbor) for neighbor in self.neighbors(node)]
+
+    def ego_nodes(self, node, k=1):
+        """Nodes at most k hops away from node, node included (breadth-first)"""
+        visited = {node}
+        frontier = [node]
+        for _ in range(k):
+            frontier = [nbr for n in frontier for nbr in self.neighbors(n) if nbr not in visited]
+            frontier = list(dict.fromkeys(frontier))
+            visited.update(frontier)
+            if not frontier:
+                break
+        return list(visited)
+
+    def ego(self, node, k=1) -> nx.Graph:
+        """Subgraph induced by the k-hop neighbourhood of node"""
+        return self.graph.subgraph(self.ego_nodes(node, k)).copy()
 
     def select(self, nodes=None, edges=None):
         if nodes:
@@ -298,6 +400,8 @@ class Graph(QObject):
             if len(data.keys()) == 0:
                 remove_arr.append(node)
         [self.graph.remove_node(node) for node in remove_arr]
+        if remove_arr:
+            self.metric_engine.invalidate()
         return self.graph
 
     def reset(self):
@@ -1,5 +1,4 @@
 import os
-import pickle
 import matplotlib
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
 from matplotlib.figure import Figure
@@ -8,10 +7,12 @@ from PyQt6.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QLabel, QSlider,
 from PyQt6.QtGui import QFont, QIcon
 from PyQt6.QtCore import Qt
 
-from src.static import PageState, GRAPH_VERSION_FOLDER, GRAPH_DATA
-from src.graph import Graph
+from src.static import PageState, GRAPH_VERSION_FOLDER, GRAPH_DATA, MANIFESTS, version_file
+from src.storage.timeline import TIMELINE_CACHE, source_key
 from src.gui.social_graph.graph import GraphCanvas
 from ..custom_buttons import BlueArrowButton
+from .timeline_worker import TimelineWorker
+from .version_cache import VERSION_CACHE
 
 matplotlib.use("Qt5Agg")
 
@@ -31,7 +32,7 @@ class GraphEvolution(QWidget):
         self.graph_gui.normal_edge_width = 0.5
         self.info_tab = QLabel(text="Placeholder", alignment=Qt.AlignmentFlag.AlignCenter)
 
-        # Precalculate changes over time
+        # Changes over time: cached ones now, the others computed in the background
         self._calculate_graph_changes()
 
         # Load current graph information and replacing the placeholder
@@ -39,28 +40,57 @@ class GraphEvolution(QWidget):
 
         # Building up graphical interface on generated information
         self.build_layout()
+        self.worker.start()
 
     def _calculate_graph_changes(self):
-
-        graphs = {}
+        """Fill the timeline with the cached points and start a worker for the missing ones"""
+        self.animal = PageState.id
+        self.lineage = []  # (version, path, sources) of every evolution
         animal_folder = os.path.join(GRAPH_VERSION_FOLDER, PageState.id)
+        prev_source = None
         for evolution in self.evolutions:
             if evolution == "default":
                 current_file = GRAPH_DATA[PageState.category][PageState.id]["path"]
-                graph = Graph.from_graphml(current_file)
             else:
-                current_file = os.path.join(animal_folder, evolution + ".pkl")
-                graph = Graph.from_pkl(current_file)
-            graphs[evolution] = graph
-
-        self._avg_degrees = {e: graphs[e].avg_degree for e in self.evolutions}
-        self._avg_coeffs = {e: graphs[e].avg_coeff for e in self.evolutions}
-        self._n_nodes = {e: graphs[e].n_nodes for e in self.evolutions}
-
-        # Setting up differences between graphs
-        self.differences = {"default": graphs['default'].difference_to(None)}
-        for prev_evolution, evolution in zip(self.evolutions[:-1], self.evolutions[1:]):
-            self.differences[evolution] = graphs[evolution].difference_to(graphs[prev_evolution])
+                current_file = version_file(animal_folder, evolution)
+            source = source_key(current_file)
+            self.lineage.append((evolution, current_file, (source, prev_source)))
+            prev_source = source
+
+        self._avg_degrees, self._avg_coeffs, self._n_nodes = {}, {}, {}
+        self.differences = {}
+        for evolution, _, sources in self.lineage:
+            point = TIMELINE_CACHE.get(PageState.id, evolution, sources)
+            if point is not None:
+                self._add_point(evolution, point)
+
+        self.worker = TimelineWorker(PageState.id, self.lineage)
+        self.worker.point_ready.connect(self._point_ready)
+
+    def _add_point(self, evolution, point):
+        self._avg_degrees[evolution] = point["avg_degree"]
+        self._avg_coeffs[evolution] = point["avg_coeff"]
+        self._n_nodes[evolution] = point["n_nodes"]
+        self.differences[evolution] = point["difference"]
+
+    def _point_ready(self, evolution, point):
+        """Slot of the timeline worker: plot the new point, highlight changes of the shown version"""
+        if evolution not in [version for version, _, _ in self.lineage]:
+            return
+        self._add_point(evolution, point)
+        self._update_plots(data=True)
+        if evolution == self.evolutions[self.evolution_id]:
+            self._highlight_changes()
+
+    def is_current(self):
+        """True if the page shows the lineage of the current version and none of its files changed"""
+        return (self.animal == PageState.id and
+                self.evolutions == [evolution for evolution, _, _ in self.lineage] and
+                all(source_key(path) == sources[0] for _, path, sources in self.lineage))
+
+    def close_timeline(self):
+        """Stop the background computation, the points computed so far stay cached"""
+        self.worker.stop()
 
     # ===============================================
     # GUI build up
@@ -86,9 +116,9 @@ class GraphEvolution(QWidget):
         self.content_layout.addWidget(self.graph_gui, 1, 0)  # Graph at top-left
 
         # Create additional plots
-        self.top_right_plot = self._create_plot(self._avg_degrees, "Mean degree")
-        self.bottom_left_plot = self._create_plot(self._avg_coeffs, "Mean clustering coefficient")
-        self.bottom_right_plot = self._create_plot(self._n_nodes, "Number of nodes")
+        self.top_right_plot = self._create_plot("_avg_degrees", "Mean degree")
+        self.bottom_left_plot = self._create_plot("_avg_coeffs", "Mean clustering coefficient")
+        self.bottom_right_plot = self._create_plot("_n_nodes", "Number of nodes")
 
         # Add plots to the layout
         self.content_layout.addWidget(self.top_right_plot, 1, 1)
@@ -150,21 +180,29 @@ class GraphEvolution(QWidget):
         self.prev_button.clicked.connect(self._prev_button_on_click)
         self.hlayout.addWidget(self.prev_button)
 
-    def _create_plot(self, y_values, title):
-        """Create a line plot with plot with the given y values and title."""
-        x_values = list(y_values.keys())
+    def _plot_values(self, series):
+        """y values of a series in evolution order, nan where not computed yet"""
+        values = getattr(self, series)
+        return [values.get(evolution, float("nan")) for evolution in self.evolutions]
+
+    def _create_plot(self, series, title):
+        """Create a line plot with plot with the values of the given series and title."""
         fig = Figure(dpi=100)
         ax = fig.add_subplot(111)
-        ax.plot(x_values, list(y_values.values()), marker='o')
+        # Note: x values are evolution indices, points computed later are filled in place
+        data_line, = ax.plot(range(self.n_evolutions), self._plot_values(series), marker='o')
+        ax.set_xticks(range(self.n_evolutions), [str(evolution) for evolution in self.evolutions])
         ax.set_title(title)
         ax.set_xlabel("Evolution")
         ax.set_ylabel(title)
         # Add a vertical line at the current evolution
-        line = ax.axvline(x=self.evolutions[self.evolution_id], color='r', linestyle='--')
+        line = ax.axvline(x=self.evolution_id, color='r', linestyle='--')
         canvas = FigureCanvasQTAgg(fig)
-        # Store the line and axes for later use
+        # Store the lines and axes for later use
         canvas.ax = ax
         canvas.line = line
+        canvas.data_line = data_line
+        canvas.series = series
 
         # Add margins so xlabel and ylabel fits into the space
         fig.subplots_adjust(left=0.2, right=0.9, bottom=0.2, top=0.8)
@@ -182,21 +220,8 @@ class GraphEvolution(QWidget):
 
     @property
     def evolutions(self):
-        """List of evolutions"""
-        if PageState.version == 'default':
-            return ['default']
-        animal_folder = os.path.join(GRAPH_VERSION_FOLDER, PageState.id)
-        versions = [PageState.version]
-        while True:
-            current_file = os.path.join(animal_folder, versions[-1] + ".pkl")
-            with open(current_file, "rb") as f:
-                data = pickle.load(f)
-                prev_version = data['prev_version']
-            versions.append(prev_version)
-            if prev_version == 'default':
-                break
-        versions.reverse()
-        return versions
+        """List of evolutions, read from the version manifest of the animal"""
+        return MANIFESTS[PageState.id].lineage(PageState.version)
 
     @property
     def str_statistics(self):
@@ -215,19 +240,20 @@ class GraphEvolution(QWidget):
 
     def _refresh_graph(self):
         """Refresh the graph"""
-        version = self.evolutions[self.evolution_id]
-        animal_folder = os.path.join(GRAPH_VERSION_FOLDER, PageState.id)
-
-        # Load graphs
-        if version != 'default' and os.path.exists(animal_folder) and os.listdir(animal_folder):
-            file_path = os.path.join(GRAPH_VERSION_FOLDER, PageState.id, version + ".pkl")
-            self.graph_gui.graph = Graph.from_pkl(filepath=file_path)
-        elif version == 'default':
-            self.graph_gui.graph = Graph.from_graphml(PageState.graph_path)
-        else:
+        version, file_path, _ = self.lineage[self.evolution_id]
+        if version != 'default' and not os.path.isfile(file_path):
             raise NameError(f"Version {version} does not exist")
 
-        highlighted_nodes, highlighted_edges = self.differences[version]
+        # Decoded versions are kept in memory, the neighbours are decoded while this one is shown
+        self.graph_gui.graph = self.graph_gui.graph_class.from_state_dict(VERSION_CACHE.load(version, file_path))
+        neighbours = [self.evolution_id + 1, self.evolution_id - 1, self.evolution_id + 2, self.evolution_id - 2]
+        VERSION_CACHE.prefetch([self.lineage[i][:2] for i in neighbours if 0 <= i < len(self.lineage)])
+        self._highlight_changes()
+
+    def _highlight_changes(self):
+        """Select the changes of the shown version, none until its timeline point is computed"""
+        version = self.evolutions[self.evolution_id]
+        highlighted_nodes, highlighted_edges = self.differences.get(version, ([], []))
         self.graph_gui.graph.select(nodes=highlighted_nodes, edges=highlighted_edges)
         self.graph_gui.graph.fresh_nodes = highlighted_nodes
         self.graph_gui.refresh()
@@ -238,14 +264,18 @@ class GraphEvolution(QWidget):
             self.prev_button.setEnabled(self.evolution_id != 0)
             self.next_button.setEnabled(self.evolution_id != self.n_evolutions - 1)
 
-    def _update_plots(self):
+    def _update_plots(self, data=False):
         """Move the vertical line on each plot to the new x position and redraw the plot."""
         if hasattr(self, 'top_right_plot'):
             for plot in [self.top_right_plot, self.bottom_left_plot, self.bottom_right_plot]:
                 # Update the xdata of the line
-                plot.line.set_xdata(self.evolutions[self.evolution_id])
+                plot.line.set_xdata([self.evolution_id, self.evolution_id])
+                if data:
+                    plot.data_line.set_ydata(self._plot_values(plot.series))
+                    plot.ax.relim()
+                    plot.ax.autoscale_view()
                 # Redraw the plot
-                plot.ax.figure.canvas.draw()
+                plot.ax.figure.canvas.draw_idle()
 
     # ===============================================
     # Buttons trigger actions
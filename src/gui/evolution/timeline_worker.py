@@ -0,0 +1,60 @@
+import logging
+
+from PyQt6.QtCore import QThread, pyqtSignal
+
+from src.loaders.asnr_dataloader import read_asnr_graphml
+from src.loaders.graphml_cache import GRAPHML_CACHE
+from src.storage.timeline import TIMELINE_CACHE, timeline_point
+from src.storage.versions import VERSION_STORE
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('timeline_worker')
+
+_RUNNING = set()  # Workers still running, kept alive after their page is closed
+
+
+class TimelineWorker(QThread):
+    """
+    Computes the timeline points missing from the TIMELINE_CACHE, oldest version first,
+    and emits point_ready(version, point) for each of them. Only the graphs of the
+    missing versions and of their predecessors are loaded.
+    """
+
+    point_ready = pyqtSignal(str, dict)
+
+    def __init__(self, animal, versions, parent=None):
+        """versions: [(version, path, sources)] of the lineage, sources as in TimelineCache"""
+        super().__init__(parent)
+        self.animal = animal
+        self.versions = versions
+        self.finished.connect(lambda: _RUNNING.discard(self))
+
+    def start(self, *args, **kwargs):
+        _RUNNING.add(self)
+        super().start(*args, **kwargs)
+
+    def stop(self):
+        """Stop after the version being computed, its point is still cached"""
+        self.requestInterruption()
+
+    def run(self):
+        prev_graph = None
+        for i, (version, path, sources) in enumerate(self.versions):
+            if self.isInterruptionRequested():
+                return
+            if TIMELINE_CACHE.get(self.animal, version, sources) is not None:
+                prev_graph = None
+                continue
+            graph = self._read(version, path)
+            if i > 0 and prev_graph is None:
+                prev_graph = self._read(*self.versions[i - 1][:2])
+            point = timeline_point(graph, prev_graph)
+            TIMELINE_CACHE.put(self.animal, version, sources, point)
+            self.point_ready.emit(version, point)
+            prev_graph = graph
+
+    @staticmethod
+    def _read(version, path):
+        if version == "default":
+            return GRAPHML_CACHE.load(path, read=read_asnr_graphml)
+        return VERSION_STORE.load(path)["graph"]
@@ -0,0 +1,111 @@
+import logging
+import threading
+from collections import OrderedDict
+
+from PyQt6.QtCore import QThread
+
+from src.loaders.asnr_dataloader import read_asnr_graphml
+from src.loaders.graphml_cache import GRAPHML_CACHE
+from src.static import EVOLUTION_CACHE_SIZE
+from src.storage.timeline import source_key
+from src.storage.versions import VERSION_STORE
+from src.gui.social_graph.graph import GraphCanvas, canvas_layout
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('version_cache')
+
+_RUNNING = set()  # Prefetch workers still running
+
+
+class VersionCache:
+    """
+    Decoded versions shown by the evolution page: the last `size` state dicts, with the
+    position of every node already laid out, keyed by the source_key of their file.
+
+    Versions next to the shown one are decoded ahead by a PrefetchWorker. A version being
+    decoded by the worker is waited for instead of being decoded twice. Callers get their
+    own copy of the graph and layout.
+    """
+
+    def __init__(self, size=EVOLUTION_CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()  # (version, source) -> state_dict
+        self._pending = {}  # (version, source) -> Event set once decoded
+        self._lock = threading.Lock()
+
+    def load(self, version, path) -> dict:
+        """state_dict of the version saved at path ('default': the GraphML file of the animal)"""
+        key = (version, source_key(path))
+        while True:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    return self._copy(self._entries[key])
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = threading.Event()
+                    break
+            pending.wait()
+
+        try:
+            state_dict = self._decode(version, path)
+            with self._lock:
+                self._entries[key] = state_dict
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.set()
+        return self._copy(state_dict)
+
+    def __contains__(self, item):
+        version, path = item
+        return (version, source_key(path)) in self._entries
+
+    def prefetch(self, versions):
+        """Decode the [(version, path)] not cached yet in a worker thread, in the given order"""
+        missing = [item for item in versions[:self.size] if item not in self]
+        if missing:
+            PrefetchWorker(self, missing).start()
+
+    @staticmethod
+    def _decode(version, path):
+        if version == "default":
+            state_dict = {"graph": GRAPHML_CACHE.load(path, read=read_asnr_graphml), "node_layout": None}
+        else:
+            state_dict = VERSION_STORE.load(path)
+        state_dict["node_layout"] = canvas_layout(state_dict["graph"], state_dict["node_layout"],
+                                                  engine=GraphCanvas.layout_engine)
+        return state_dict
+
+    @staticmethod
+    def _copy(state_dict):
+        state_dict = dict(state_dict)
+        state_dict["graph"] = state_dict["graph"].copy()
+        state_dict["node_layout"] = dict(state_dict["node_layout"])
+        return state_dict
+
+
+class PrefetchWorker(QThread):
+    """Decodes versions into a VersionCache in the background"""
+
+    def __init__(self, cache: VersionCache, versions):
+        super().__init__()
+        self.cache = cache
+        self.versions = versions
+        self.finished.connect(lambda: _RUNNING.discard(self))
+
+    def start(self, *args, **kwargs):
+        _RUNNING.add(self)
+        super().start(*args, **kwargs)
+
+    def run(self):
+        for version, path in self.versions:
+            try:
+                self.cache.load(version, path)
+            except Exception:
+                logger.exception(f"Could not prefetch version {version}.")
+
+
+VERSION_CACHE = VersionCache()
@@ -8,6 +8,7 @@ from collections import defaultdict
 from textwrap import wrap
 from .modularity import Modularity
 from src.gui.social_graph.graph import GraphCanvas
+from src.storage.analytics_cache import ANALYTICS_CACHE
 from mycolorpy import colorlist as mcp
 from ..colors import cmap1, cmap1_str
 
@@ -398,7 +399,26 @@ class GraphAnalytics(QWidget):
         return FigureCanvasQTAgg(fig)
 
     def graph_analytics_table(self):
-        graph = self.parent.graph_page.graph_page.graph.graph
+        graph_metrics = ANALYTICS_CACHE.get_or_compute(self.graph.fingerprint,
+                                                       "graph_analytics_table",
+                                                       self._graph_metrics)
+        table = QTableWidget()
+        table.setRowCount(len(graph_metrics))
+        table.setColumnCount(2)
+        table.setHorizontalHeaderLabels(['Metric', 'Value'])
+        table.verticalHeader().setVisible(False)
+        # table.setVerticalHeaderLabels(graph_metrics.keys())
+        for i, (metric, value) in enumerate(graph_metrics.items()):
+            table.setItem(i, 0, QtWidgets.QTableWidgetItem(metric))
+            table.setItem(i, 1, QtWidgets.QTableWidgetItem(str(value)))
+        table.resizeColumnsToContents()
+        table.resizeRowsToContents()
+
+        return table
+
+    def _graph_metrics(self):
+        graph = self.graph.graph
+        centrality = self.graph.centrality_dict
         n = graph.number_of_nodes()
         try:
             diam = nx.diameter(graph)
@@ -427,29 +447,17 @@ class GraphAnalytics(QWidget):
             'Average Shortest Path':
                 avg_sp,
             'Average Betweenness Centrality':
-                round(sum([b for _, b in nx.betweenness_centrality(graph).items()]) / n, 3),
+                round(sum([b for _, b in centrality["betweeness"].items()]) / n, 3),
             'Average Closeness Centrality':
-                round(sum([c for _, c in nx.closeness_centrality(graph).items()]) / n, 3),
+                round(sum([c for _, c in centrality["closeness"].items()]) / n, 3),
             'Average Eigenvector Centrality':
                 ev_cent,
             'Average PageRank':
                 round(sum([p for _, p in nx.pagerank(graph).items()]) / n, 3),
             'Average Degree Centrality':
-                round(sum([d for _, d in nx.degree_centrality(graph).items()]) / n, 3)
+                round(sum([d for _, d in centrality["degree"].items()]) / n, 3)
         }
-        table = QTableWidget()
-        table.setRowCount(len(graph_metrics))
-        table.setColumnCount(2)
-        table.setHorizontalHeaderLabels(['Metric', 'Value'])
-        table.verticalHeader().setVisible(False)
-        # table.setVerticalHeaderLabels(graph_metrics.keys())
-        for i, (metric, value) in enumerate(graph_metrics.items()):
-            table.setItem(i, 0, QtWidgets.QTableWidgetItem(metric))
-            table.setItem(i, 1, QtWidgets.QTableWidgetItem(str(value)))
-        table.resizeColumnsToContents()
-        table.resizeRowsToContents()
-
-        return table
+        return graph_metrics
 
     def attribute_distribution_cont(self):
         fig = Figure(figsize=(7, 5), dpi=100)
@@ -16,6 +16,7 @@ from matplotlib.figure import Figure
 from mpl_toolkits.axes_grid1.inset_locator import inset_axes
 
 from mycolorpy import colorlist as mcp
+from src.storage.analytics_cache import ANALYTICS_CACHE, graph_fingerprint
 
 
 
@@ -29,7 +30,8 @@ class Modularity(QWidget):
         self.max_id, self.max_modularity = -1, -1
         self.subcommunity_n = -1 
         self.graph = graph
-        communities = list(nx.community.girvan_newman(self.graph))
+        communities, self.modularities = ANALYTICS_CACHE.get_or_compute(
+            graph_fingerprint(self.graph), "girvan_newman", self.compute_communities)
         self.bar = self.get_bar(communities)
         if self.max_id != -1:
             community = communities[self.max_id]
@@ -37,6 +39,11 @@ class Modularity(QWidget):
 
 
     
+    def compute_communities(self):
+        communities = list(nx.community.girvan_newman(self.graph))
+        modularities = [nx.community.modularity(self.graph, c) for c in communities]
+        return communities, modularities
+
     def get_bar(self, communities):
         fig, ax  = plt.subplots()
 
@@ -47,7 +54,7 @@ class Modularity(QWidget):
         x_vals, y_vals = [], []
         start = len(communities[0])
         for k in range(len(communities)):
-            y_vals.append(nx.community.modularity(self.graph, communities[k]))
+            y_vals.append(self.modularities[k])
             x_vals.append(start+k)
         
         
@@ -65,6 +65,11 @@ class MainWindow(QMainWindow):
         self.tabs.insertTab(1, self.graph_analytics, "Graph Analytics")  # <--- add tab
 
     def updateGraphEvolveTab(self):
+        # Note: the timeline is kept while the lineage and its files are unchanged
+        if self.graph_evolution is not None:
+            if self.graph_evolution.is_current():
+                return
+            self.graph_evolution.close_timeline()
         self.tabs.removeTab(2)
         self.graph_evolution = GraphEvolution(self)
         self.tabs.insertTab(2, self.graph_evolution, "Evolution")
@@ -1,19 +1,49 @@
 import networkx as nx
 import matplotlib
 from matplotlib import pyplot as plt
-import math
 from copy import deepcopy
+from contextlib import contextmanager
 
 matplotlib.use("Qt5Agg")
 
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
 from matplotlib.figure import Figure
 from netgraph import InteractiveGraph
+from netgraph._main import BASE_SCALE
+from PyQt6.QtCore import QTimer
 
 from src.graph import Graph
+from src.layout import LAYOUT_ENGINES, layout_engine, place_nodes
+from src.static import HOVER_INTERVAL
+from src.storage.analytics_cache import ANALYTICS_CACHE, graph_fingerprint
 
 # SHADES = plt.get_cmap("Pastel1")
 from ..colors import cmap1
+from .node_index import NodeIndex
+
+
+def canvas_layout(graph: nx.Graph, node_layout=None, fingerprint=None, engine="auto") -> dict:
+    """
+    Position of every node. Nodes of node_layout keep their position, nodes missing from it
+    are placed next to their neighbours (see place_nodes). A graph without a layout, or
+    mostly new to it, gets the (cached) full layout of the engine, see LAYOUT_ENGINES:
+    fingerprint() gives the key of the graph in the analytics cache.
+    """
+    if node_layout:
+        missing = [node for node in graph if node not in node_layout]
+        if 2 * len(missing) <= len(graph):
+            placed = place_nodes(graph, node_layout, missing)
+            return {node: placed[node] if node in placed else node_layout[node] for node in graph}
+
+    engine = layout_engine(engine, graph.order())
+    pos = ANALYTICS_CACHE.get_or_compute(
+        fingerprint() if fingerprint is not None else graph_fingerprint(graph), f"{engine}_layout",
+        lambda: LAYOUT_ENGINES[engine](graph))
+
+    if node_layout is not None:
+        for key, value in pos.items():
+            pos[key] = node_layout[key] if key in node_layout else value
+    return pos
 
 
 class GraphCanvas(FigureCanvasQTAgg):
@@ -21,6 +51,11 @@ class GraphCanvas(FigureCanvasQTAgg):
     Graph page, containing the graph and handling events such as clicks or hovers.
     """
 
+    # Graph backend, e.g. src.csr_graph.CSRGraph for large colonies
+    graph_class = Graph
+    # Layout of graphs drawn for the first time: "spring", "multilevel", or "auto" to pick by size
+    layout_engine = "auto"
+
     def __init__(self, parent=None, width=5, height=4, dpi=100):
         super(GraphCanvas, self).__init__(Figure(figsize=(width, height), dpi=dpi))
         self.parent = parent
@@ -30,12 +65,41 @@ class GraphCanvas(FigureCanvasQTAgg):
         self.normal_edge_width = 1.
         self.setParent(parent)
         self.ax = self.figure.add_subplot(111)
-
-        self.graph = Graph.from_page_info()
+        self._batch_depth = 0
+        self._refresh_pending = False
+        self._graph = None
+        self._drawn = None  # Style of the drawn artists, None when they must be rebuilt
+        self._node_index = None
+        self._pressed = False  # Mouse button down, nodes may be dragged
+        self._hovered = None  # Node shown on the hover panel ("" for none)
+        self._hover_xy = None  # Last hovered position, handled by the hover timer
+        self._hover_timer = QTimer(self)
+        self._hover_timer.setSingleShot(True)
+        self._hover_timer.setInterval(HOVER_INTERVAL)
+        self._hover_timer.timeout.connect(self._hover)
+
+        self.graph = self.graph_class.from_page_info()
+        self.mpl_connect('button_press_event', self.onpress)
         self.mpl_connect('button_release_event', self.onclick)
         self.mpl_connect('motion_notify_event', self.on_hover)
         self.refresh()
 
+    @property
+    def graph(self):
+        return self._graph
+
+    @graph.setter
+    def graph(self, value):
+        if self._graph is not None:
+            self._graph.graph_updated.disconnect(self._invalidate_drawing)
+        self._graph = value
+        self._graph.graph_updated.connect(self._invalidate_drawing)
+        self._invalidate_drawing()
+
+    def _invalidate_drawing(self):
+        self._drawn = None
+        self._hovered = None
+
     @property
     def features(self):
         return self.graph.features
@@ -44,6 +108,10 @@ class GraphCanvas(FigureCanvasQTAgg):
     def metrics(self):
         return self.graph.metrics
 
+    @property
+    def node_records(self):
+        return self.graph.node_records
+
     @property
     def node_colors(self):
         if not hasattr(self, '_node_colors'):
@@ -61,6 +129,7 @@ class GraphCanvas(FigureCanvasQTAgg):
     @node_colors.setter
     def node_colors(self, value):
         self._node_colors = value
+        self._invalidate_drawing()
 
     @property
     def node_sizes(self):
@@ -119,12 +188,16 @@ class GraphCanvas(FigureCanvasQTAgg):
         return width
 
     def refresh(self):
-        self.ax.cla()  # Clears the existing plot
-        pos = nx.spring_layout(self.graph.graph, k=math.sqrt(1 / self.graph.graph.order()), seed=42)
+        """Restyle the drawn graph if only its selection changed, draw it again otherwise"""
+        style = self._style()
+        if self._drawn is not None and self._drawn["n_nodes"] == len(self.graph.graph) \
+                and self._restyle(style):
+            self._drawn = style
+            return
 
-        if self.graph.node_layout is not None:
-            for key, value in pos.items():
-                pos[key] = self.graph.node_layout[key] if key in self.graph.node_layout else value
+        self.ax.cla()  # Clears the existing plot
+        pos = canvas_layout(self.graph.graph, self.graph.node_layout, lambda: self.graph.fingerprint,
+                            self.layout_engine)
 
         self.plot_instance = InteractiveGraph(self.graph.graph,
                                               node_color=self.node_colors,
@@ -136,11 +209,83 @@ class GraphCanvas(FigureCanvasQTAgg):
                                               node_layout=pos,
                                               ax=self.ax)
         self.graph.node_layout = deepcopy(self.plot_instance.node_positions)
+        self._drawn = style
+
+    # =====================================================
+    # Style diff: selection changes update the existing artists
+    # =====================================================
+
+    def _style(self):
+        """What the style of the artists depends on, besides the graph itself"""
+        return {
+            "n_nodes": len(self.graph.graph),
+            "widths": (self.highligh_node_width, self.normal_node_width,
+                       self.highligh_edge_width, self.normal_edge_width),
+            "selected_nodes": set(self.graph.selected_nodes),
+            "selected_edges": {frozenset(edge) for edge in self.graph.selected_directed_edges},
+            "predicted": set(self.graph.predicted_new_node_names),
+            "unpredicted": set(self.graph.unpredicted_new_node_names),
+        }
+
+    def _restyle(self, style) -> bool:
+        """
+        Update the linewidth of the nodes and the color and width of the edges whose selection
+        changed since the last drawing, then draw once. False (nothing updated) if the status of a
+        node changed: it changes its shape, which needs new artists.
+        """
+        drawn = self._drawn
+        if style["widths"] != drawn["widths"] or style["predicted"] != drawn["predicted"] \
+                or style["unpredicted"] != drawn["unpredicted"]:
+            return False
+
+        for node in style["selected_nodes"] ^ drawn["selected_nodes"]:
+            artist = self.plot_instance.node_artists.get(node)
+            if artist is None:
+                continue
+            width = self.highligh_node_width if node in style["selected_nodes"] else self.normal_node_width
+            artist.set_linewidth(width * BASE_SCALE)
+            # Note: netgraph restores this linewidth when its own selection is cleared
+            self.plot_instance._base_linewidth[artist] = artist._lw_data
+
+        for edge in style["selected_edges"] ^ drawn["selected_edges"]:
+            source, target = tuple(edge) * 2 if len(edge) == 1 else tuple(edge)
+            artist = self.plot_instance.edge_artists.get((source, target),
+                                                         self.plot_instance.edge_artists.get((target, source)))
+            if artist is None:
+                continue
+            if edge in style["selected_edges"]:
+                width, color = self.highligh_edge_width, "tab:blue"
+            else:
+                width, color = self.normal_edge_width, "tab:gray"
+            artist.update_width(width * BASE_SCALE)
+            artist.set_facecolor(color)
+
+        self.draw_idle()
+        return True
+
+    @contextmanager
+    def batch(self):
+        """Group edits on the canvas: the page is refreshed once, when the outermost batch exits"""
+        self._batch_depth += 1
+        try:
+            with self.graph.batch():
+                yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth and self._refresh_pending:
+                self._refresh_pending = False
+                self.parent.graph_page.refresh()
+
+    def _refresh_page(self):
+        if self._batch_depth:
+            self._refresh_pending = True
+        else:
+            self.parent.graph_page.refresh()
 
     def add_nodes(self, new_nodes, refresh=True):
         self.graph.add_nodes(new_nodes)
         if refresh:
-            self.parent.graph_page.refresh()
+            self._refresh_page()
 
     def add_node(self, new_node, refresh=True):
         self.add_nodes([new_node], refresh)
@@ -148,17 +293,15 @@ class GraphCanvas(FigureCanvasQTAgg):
     def add_edges(self, new_edges, refresh=True):
         self.graph.add_edges(new_edges)
         if refresh:
-            self.parent.graph_page.refresh()
+            self._refresh_page()
 
     def add_edge(self, new_edge, refresh=True):
         self.add_edges([new_edge], refresh)
-        if refresh:
-            self.parent.graph_page.refresh()
 
     def remove_nodes(self, new_nodes, refresh=True):
         self.graph.remove_nodes(new_nodes)
         if refresh:
-            self.parent.graph_page.refresh()
+            self._refresh_page()
 
     def remove_node(self, new_node, refresh=True):
         self.remove_nodes([new_node], refresh)
@@ -166,21 +309,26 @@ class GraphCanvas(FigureCanvasQTAgg):
     def remove_edges(self, new_edges, refresh=True):
         self.graph.remove_edges(new_edges)
         if refresh:
-            self.parent.graph_page.refresh()
+            self._refresh_page()
 
     def remove_edge(self, new_edge, refresh=True):
         self.remove_edges([new_edge], refresh)
-        if refresh:
-            self.parent.graph_page.refresh()
+
+    def onpress(self, event):
+        self._pressed = True
 
     def onclick(self, event):
+        if self._pressed:
+            # Nodes may have been dragged while the button was down
+            self._pressed = False
+            self._node_index = None
         if event.xdata is not None:
             # Clicked on a node
             node_name, _, is_hovering, was_dragged = self.get_closest_node(event.xdata, event.ydata)
             if is_hovering and not was_dragged:
                 # Click
                 self.parent.graph_page.right_page.show()
-                self.parent.graph_page.right_page.update(node_name, self.features, self.metrics)
+                self.parent.graph_page.right_page.update(node_name, self.node_records)
                 self.parent.graph_page.graph_page.graph.toggle_status_of_node(node_name)
                 self.parent.graph_page.refresh()
             elif is_hovering and was_dragged:
@@ -194,29 +342,43 @@ class GraphCanvas(FigureCanvasQTAgg):
             self.parent.graph_page.refresh()
 
     def on_hover(self, event):
-
-        if event.xdata is not None:
-            node_name, _, is_hovering, _ = self.get_closest_node(event.xdata, event.ydata)
+        # Note: motion events are coalesced, the last position is handled once per HOVER_INTERVAL
+        if self._pressed:
+            return
+        self._hover_xy = (event.xdata, event.ydata) if event.xdata is not None else None
+        if not self._hover_timer.isActive():
+            self._hover_timer.start()
+
+    def _hover(self):
+        if self._hover_xy is not None:
+            node_name, _, is_hovering, _ = self.get_closest_node(*self._hover_xy)
         else:
             is_hovering = False
+        node_name = node_name if is_hovering else ""
 
+        # The panel is only filled again when the hovered node changes
+        if node_name == self._hovered:
+            return
+        self._hovered = node_name
         if is_hovering:
-            self.parent.graph_page.left_page.update(node_name, self.features, self.metrics)
+            self.parent.graph_page.left_page.update(node_name, self.node_records)
         else:
             self.parent.graph_page.left_page.update("")
 
+    @property
+    def node_index(self) -> NodeIndex:
+        """Spatial index of the drawn nodes, built again after they moved or the graph was drawn again"""
+        positions = self.plot_instance.node_positions
+        if self._node_index is None or self._node_index.stale(positions):
+            self._node_index = NodeIndex(positions)
+        return self._node_index
+
     def get_closest_node(self, x, y):
-        # Loop over all nodes, select the one closest to click
-        closest_node = None
-        distance = 999999
-        closest_node_name = None
-        for name in self.plot_instance.node_artists:
-            node = self.plot_instance.node_artists[name]
-            dist = ((x - node.xy[0])**2 + (y - node.xy[1])**2)**0.5
-            if dist < distance:
-                distance = dist
-                closest_node = node
-                closest_node_name = name
+        # Node closest to the click, from the spatial index
+        closest_node_name, distance = self.node_index.closest(x, y)
+        if closest_node_name is None:
+            return None, None, False, False
+        closest_node = self.plot_instance.node_artists[closest_node_name]
 
         hovering = distance < closest_node.radius
         was_dragged = False
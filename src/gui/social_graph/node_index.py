@@ -0,0 +1,31 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class NodeIndex:
+    """
+    KD-tree over the node positions of a drawing, answers the closest node in O(log n).
+
+    The index is built from the positions when it is created: when nodes are moved, added
+    or removed, see `stale` and build a new one.
+    """
+
+    def __init__(self, node_positions: dict):
+        self.positions = node_positions
+        self.names = list(node_positions)
+        points = np.array([node_positions[name] for name in self.names], dtype=np.float64).reshape(-1, 2)
+        self.tree = cKDTree(points) if self.names else None
+
+    def __len__(self):
+        return len(self.names)
+
+    def stale(self, node_positions) -> bool:
+        """True if the index was built from other positions, or nodes were added or removed since"""
+        return node_positions is not self.positions or len(node_positions) != len(self.names)
+
+    def closest(self, x, y):
+        """(name, distance) of the node closest to (x, y), (None, inf) if there is no node"""
+        if self.tree is None:
+            return None, np.inf
+        distance, i = self.tree.query((x, y))
+        return self.names[i], distance
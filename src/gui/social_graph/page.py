@@ -37,10 +37,8 @@ class GraphPage(QWidget):
         # Sub-pages definition
         self.versionlabel = QLabel("Version: " + PageState.version)
         self.graph_page = GraphCanvas(parent, width=5, height=2, dpi=100)
-        self.left_page = NodeInfoPage(self.graph_page.features, self.graph_page.metrics)
-        self.right_page = NodeInfoPage(self.graph_page.features,
-                                       self.graph_page.metrics,
-                                       title="Selected Node")
+        self.left_page = NodeInfoPage(self.graph_page.node_records)
+        self.right_page = NodeInfoPage(self.graph_page.node_records, title="Selected Node")
         self.top_page = InfoPage(self.graph_page.graph.graph)
         self.color_bar = ColorBar(parent, self.graph_page.graph)
         self.adj_matrix = FullScreenWidget(self.graph_page.graph, self)
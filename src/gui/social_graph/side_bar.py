@@ -2,21 +2,20 @@ from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel, QTableWidget, QTableWi
 from PyQt6.QtCore import *
 from PyQt6.QtGui import *
 
-from src.utils.common import swap_dict_keys
+from src.node_records import NodeRecords
 
 
 class NodeInfoPage(QWidget):
 
-    def __init__(self, features, metrics, title="Features"):
+    def __init__(self, records: NodeRecords, title="Features"):
         super(NodeInfoPage, self).__init__()
 
         self.WIDTH = 210
         self.CELL_HEIGHT = 30
-        self.FEATURES = None
-        self.METRICS = None  # None == select all
+        self.FEATURES = records.feature_columns
+        self.METRICS = records.metric_columns
 
-        self.features = features
-        self.metrics = swap_dict_keys(metrics)
+        self.records = records
         self.setFixedWidth(self.WIDTH)
 
         self.layout = QVBoxLayout()
@@ -26,24 +25,22 @@ class NodeInfoPage(QWidget):
         self.feature_title_label.setStyleSheet("font-weight: bold; font-size: 16px;")
         self.layout.addWidget(self.feature_title_label)
 
-        for _, data in self.features.items():
-            self.FEATURES = data.keys()
-            break
-        self.feature_table = self._create_table(self.features, self.WIDTH, self.FEATURES)
+        # first entry of the features table is Name
+        self.feature_table = self._create_table(["Name"] + self.FEATURES, self.WIDTH)
         self.layout.addWidget(self.feature_table)
 
         self.metric_title_label = QLabel("Centrality Metrics")
         self.metric_title_label.setStyleSheet("font-weight: bold; font-size: 16px;")
         self.layout.addWidget(self.metric_title_label)
 
-        self.metric_table = self._create_table(metrics, self.WIDTH, self.METRICS)
+        self.metric_table = self._create_table(self.METRICS, self.WIDTH)
         self.layout.addWidget(self.metric_table)
 
         self.layout.addStretch(1)
 
         self.must_be_visible = False
 
-    def _create_table(self, data, width, columns=None):
+    def _create_table(self, columns, width):
         table = QTableWidget()
         table.setFixedWidth(width)
         table.setColumnCount(2)
@@ -54,13 +51,6 @@ class NodeInfoPage(QWidget):
         table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
 
         # Populate the table with titles and dummy values
-        columns = columns if columns is not None else list(data.keys())
-
-        # if it is a feature table
-        if "betweeness" not in columns:  # first entry of the features table is Name
-            columns = list(columns)
-            columns.insert(0, "Name")
-
         for key in columns:
             row = table.rowCount()
             table.insertRow(row)
@@ -73,22 +63,21 @@ class NodeInfoPage(QWidget):
 
         return table
 
-    def update(self, node_name, features=None, metrics=None):
+    def update(self, node_name, records: NodeRecords = None):
 
         if node_name:
             self.must_be_visible = True
-            self.features = features
-            self.metrics = swap_dict_keys(metrics)
-            self._update_table(self.feature_table, self.features[node_name], node_name=node_name)
-            self._update_table(self.metric_table, self.metrics[node_name])
-
-    def _update_table(self, table, data, node_name=None):
-        for row in range(table.rowCount()):
-            key_item = table.item(row, 0)
-            if node_name and key_item.text().lower() == "name":
-                value = node_name
-            else:
-                value = data.get(key_item.text(), "")
+            if records is not None:
+                self.records = records
+            # Note: one row lookup, the columns of the tables are looked up in the record order
+            row = self.records.row(node_name)
+            index = self.records.index
+            self._update_table(self.feature_table, [node_name] + [
+                row[index[column]] if column in index else None for column in self.FEATURES])
+            self._update_table(self.metric_table, [
+                row[index[column]] if column in index else None for column in self.METRICS])
+
+    def _update_table(self, table, values):
+        for row, value in enumerate(values):
             value = f"{value:.2f}" if isinstance(value, float) else value
-            item = QTableWidgetItem(str(value))
-            table.setItem(row, 1, item)
\ No newline at end of file
+            table.item(row, 1).setText("" if value is None else str(value))
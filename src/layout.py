@@ -0,0 +1,327 @@
+from __future__ import annotations
+
+import math
+import logging
+import numpy as np
+import networkx as nx
+
+from .static import MULTILEVEL_LAYOUT_MIN_NODES
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('layout')
+
+
+def _weight(data):
+    # Note: same weights as nx.spring_layout, which laid out the other nodes
+    return data.get("weight", 1)
+
+
+# =====================================================
+# Incremental placement
+# =====================================================
+
+def place_nodes(graph: nx.Graph, node_layout: dict, nodes=None, iterations=50, seed=42) -> dict:
+    """
+    Positions of nodes (default: the nodes of graph missing from node_layout), every node
+    of node_layout keeps its position.
+
+    A new node starts at the mean position of its placed neighbours, nodes without any go
+    just outside the layout. A short force-directed relaxation (Fruchterman-Reingold forces,
+    as in nx.spring_layout, repulsion cut off at twice the local node spacing) then moves only the
+    new nodes, against their neighbours and the placed nodes up to two hops away, so the
+    cost grows with the size of their neighbourhoods instead of the graph.
+    """
+    adj = graph.adj
+    nodes = [node for node in graph if node not in node_layout] if nodes is None else list(nodes)
+    if not nodes:
+        return {}
+    rng = np.random.default_rng(seed)
+    new = set(nodes)
+
+    # Placed nodes near the new ones, they push the new nodes but do not move
+    local = list(dict.fromkeys(
+        nbr for node in nodes for first in adj[node] for nbr in [first, *adj[first]]
+        if nbr not in new and nbr in node_layout))
+    fixed = np.array([node_layout[node] for node in local], dtype=np.float64).reshape(-1, 2)
+    k = _spacing(fixed, len(graph))
+
+    # Seeds: breadth first from the placed nodes, each new node next to its placed neighbours
+    positions = {}
+    remaining = list(nodes)
+    while remaining:
+        unplaced = []
+        for node in remaining:
+            anchors = [node_layout[nbr] if nbr in node_layout else positions[nbr]
+                       for nbr in adj[node] if nbr != node and (nbr in node_layout or nbr in positions)]
+            if anchors:
+                positions[node] = np.mean(anchors, axis=0) + rng.uniform(-0.5, 0.5, 2) * k
+            else:
+                unplaced.append(node)
+        if len(unplaced) == len(remaining):
+            break
+        remaining = unplaced
+    if remaining:
+        # Not connected to any placed node: around the layout, on a circle through its corners
+        corners = fixed if len(fixed) else np.array(list(node_layout.values()), dtype=np.float64).reshape(-1, 2)
+        center = corners.mean(axis=0) if len(corners) else np.zeros(2)
+        radius = (np.abs(corners - center).max() if len(corners) else 0) + k
+        angles = rng.uniform(0, 2 * np.pi, len(remaining))
+        for node, angle in zip(remaining, angles):
+            positions[node] = center + radius * np.array([np.cos(angle), np.sin(angle)])
+
+    index = {node: i for i, node in enumerate(nodes)}
+    index.update((node, len(nodes) + i) for i, node in enumerate(local))
+    edges = [(index[node], index[nbr], _weight(data)) for node in nodes
+             for nbr, data in adj[node].items() if nbr != node and nbr in index]
+    pos = _relax(np.array([positions[node] for node in nodes]), fixed, edges, k, iterations)
+    return dict(zip(nodes, pos))
+
+
+def _spacing(fixed, n_nodes):
+    """Twice the median distance from a local placed node to the closest other one"""
+    if len(fixed) < 2:
+        return 2 / np.sqrt(max(n_nodes, 1))
+    sample = fixed[:256]
+    distance = np.linalg.norm(sample[:, None, :] - fixed[None, :, :], axis=-1)
+    distance[distance == 0] = np.inf
+    closest = distance.min(axis=1)
+    closest = closest[np.isfinite(closest)]
+    return 2 * float(np.median(closest)) if len(closest) else 2 / np.sqrt(max(n_nodes, 1))
+
+
+def _relax(pos, fixed, edges, k, iterations):
+    """Fruchterman-Reingold iterations moving only pos, against fixed and each other"""
+    n = len(pos)
+    edges = np.array(edges, dtype=np.float64).reshape(-1, 3)
+    src, dst, weight = edges[:, 0].astype(np.int64), edges[:, 1].astype(np.int64), edges[:, 2]
+    not_self = np.arange(n + len(fixed))[None, :] != np.arange(n)[:, None]
+    t, dt = 0.5 * k, 0.5 * k / (iterations + 1)
+    for _ in range(iterations):
+        everything = np.concatenate([pos, fixed])
+        delta = pos[:, None, :] - everything[None, :, :]
+        distance = np.maximum(np.linalg.norm(delta, axis=-1), 0.01 * k)
+        # Repulsion k^2 / d from the nodes closer than 2k (grid variant of Fruchterman-Reingold):
+        # the placed nodes are at rest, only the neighbourhood of a new node should push it
+        force = np.einsum("ijk,ij->ik", delta, k * k / distance ** 2 * (not_self & (distance < 2 * k)))
+        # Attraction d^2 / k along the edges
+        if len(src):
+            edge_delta = everything[dst] - pos[src]
+            pull = edge_delta * (np.linalg.norm(edge_delta, axis=-1) * weight / k)[:, None]
+            np.add.at(force, src, pull)
+        length = np.maximum(np.linalg.norm(force, axis=-1), 1e-12)
+        pos = pos + force * (np.minimum(length, t) / length)[:, None]
+        t -= dt
+    return pos
+
+
+# =====================================================
+# Full layouts
+# =====================================================
+
+def spring_layout(graph: nx.Graph, seed=42) -> dict:
+    """networkx spring layout, as the graph page always drew it"""
+    return nx.spring_layout(graph, k=math.sqrt(1 / graph.order()), seed=seed)
+
+
+def multilevel_layout(graph: nx.Graph, seed=42, iterations=50, scale=1.0) -> dict:
+    """
+    Force-directed layout of large graphs (Walshaw's multilevel Fruchterman-Reingold), in numpy.
+
+    The graph is coarsened by matching every node with its heaviest free neighbour, nodes
+    left alone join the cluster of their heaviest neighbour, until a few dozen clusters are
+    left. The coarsest graph is laid out from random positions, and every level starts from
+    the positions of its clusters. Repulsion is only computed between nodes of neighbouring
+    cells of a grid of twice the ideal edge length (crowded cells push as one node), so an
+    iteration costs O(n + m) instead of O(n^2) as in nx.spring_layout. Positions are rescaled to [-scale, scale], and the
+    same seed gives the same layout.
+    """
+    nodes = list(graph)
+    if len(nodes) <= 2:
+        return nx.circular_layout(graph, scale=scale) if nodes else {}
+    index = {node: i for i, node in enumerate(nodes)}
+    edges = [(index[u], index[v], _weight(data)) for u, v, data in graph.edges(data=True) if u != v]
+    edges = np.array(edges, dtype=np.float64).reshape(-1, 3)
+    src, dst, weight = _merge_edges(len(nodes), edges[:, 0].astype(np.int64), edges[:, 1].astype(np.int64),
+                                    edges[:, 2])
+    rng = np.random.default_rng(seed)
+
+    # Coarsening: levels[l] = (n, src, dst, weight, mass), parents[l] maps level l to l + 1
+    levels = [(len(nodes), src, dst, weight, np.ones(len(nodes)))]
+    parents = []
+    while levels[-1][0] > 32:
+        n, src, dst, weight, mass = levels[-1]
+        parent = _cluster(n, src, dst, weight, rng)
+        n_coarse = int(parent.max()) + 1
+        if n_coarse > 0.8 * n:
+            break
+        parents.append(parent)
+        levels.append((n_coarse, *_merge_edges(n_coarse, parent[src], parent[dst], weight),
+                       np.bincount(parent, mass, minlength=n_coarse)))
+
+    # Ideal edge length 1 on the original graph, sqrt(7/4) times longer on every coarser level
+    k = np.sqrt(7 / 4) ** (len(levels) - 1)
+    n, src, dst, weight, mass = levels[-1]
+    pos = rng.uniform(0, np.sqrt(n) * k, (n, 2))
+    pos = _forces(pos, src, dst, weight, mass, k, 2 * iterations, k * np.sqrt(n) / 4)
+    for (n, src, dst, weight, mass), parent in zip(reversed(levels[:-1]), reversed(parents)):
+        k /= np.sqrt(7 / 4)
+        pos = pos[parent] + rng.uniform(-0.1, 0.1, (n, 2)) * k
+        # Note: large levels start from a good layout of their clusters and need fewer iterations
+        pos = _forces(pos, src, dst, weight, mass, k, max(15, min(iterations, int(iterations * np.sqrt(1000 / n)))), k)
+
+    pos -= pos.mean(axis=0)
+    pos *= scale / max(np.abs(pos).max(), 1e-12)
+    return dict(zip(nodes, pos))
+
+
+def _merge_edges(n, src, dst, weight):
+    """Edges (min, max) without self-loops, weights of parallel edges summed"""
+    keep = src != dst
+    src, dst, weight = np.minimum(src, dst)[keep], np.maximum(src, dst)[keep], weight[keep]
+    keys, inverse = np.unique(src * n + dst, return_inverse=True)
+    return keys // n, keys % n, np.bincount(inverse, weight, minlength=len(keys))
+
+
+def _cluster(n, src, dst, weight, rng):
+    """Parent cluster of every node: heavy-edge matching, lone nodes join their heaviest neighbour"""
+    order = np.argsort(np.concatenate([src, dst]), kind="stable")
+    neighbors = np.concatenate([dst, src])[order].tolist()
+    weights = np.concatenate([weight, weight])[order].tolist()
+    ptr = np.concatenate([[0], np.cumsum(np.bincount(np.concatenate([src, dst]), minlength=n))]).tolist()
+
+    parent = [-1] * n
+    heaviest = [-1] * n
+    clusters = 0
+    for i in rng.permutation(n).tolist():
+        best, best_weight, free, free_weight = -1, -1.0, -1, -1.0
+        for j, w in zip(neighbors[ptr[i]:ptr[i + 1]], weights[ptr[i]:ptr[i + 1]]):
+            if w > best_weight:
+                best, best_weight = j, w
+            if parent[j] < 0 and w > free_weight:
+                free, free_weight = j, w
+        heaviest[i] = best
+        if parent[i] >= 0:
+            continue
+        parent[i] = clusters
+        if free >= 0:
+            parent[free] = clusters
+        clusters += 1
+
+    parent = np.array(parent)
+    sizes = np.bincount(parent)
+    alone = np.flatnonzero((sizes[parent] == 1) & (np.array(heaviest) >= 0))
+    parent[alone] = parent[np.array(heaviest)[alone]]
+    return np.unique(parent, return_inverse=True)[1]
+
+
+def _repulsion(pos, mass, k, crowded=16):
+    """
+    k^2 m_j / d repulsion from the nodes j closer than 2k, found in the 3x3 cells of side 2k
+    around each node. A cell holding more than `crowded` nodes pushes as one node, of their
+    total mass at their centre of mass, so an iteration stays O(n) around hubs.
+    """
+    n = len(pos)
+    cell = np.floor((pos - pos.min(axis=0)) / (2 * k)).astype(np.int64) + 1
+    height = int(cell[:, 1].max()) + 2
+    cell_id = cell[:, 0] * height + cell[:, 1]
+    order = np.argsort(cell_id, kind="stable")
+    sorted_id = cell_id[order]
+    cells, first, inverse, sizes = np.unique(sorted_id, return_index=True, return_inverse=True, return_counts=True)
+    cell_mass = np.bincount(inverse, mass[order])
+    cell_center = np.stack([np.bincount(inverse, (mass * pos[:, axis])[order]) for axis in (0, 1)], axis=1)
+
+    # (node, delta to what pushes it, pushing mass) for all 3x3 cells, pushed at once
+    nodes, deltas, masses = [], [], []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            target = cell_id + dx * height + dy
+            c = np.minimum(np.searchsorted(cells, target), len(cells) - 1)
+            count = np.where(cells[c] == target, sizes[c], 0)
+            # Crowded cells: their centre of mass, without the node itself
+            big = np.flatnonzero(count > crowded)
+            if len(big):
+                own = float(dx == 0 and dy == 0)
+                total = cell_mass[c[big]] - own * mass[big]
+                center = (cell_center[c[big]] - own * mass[big, None] * pos[big]) / np.maximum(total, 1e-12)[:, None]
+                nodes.append(big)
+                deltas.append(pos[big] - center)
+                masses.append(total)
+                count[big] = 0
+            # Other cells: every node
+            i = np.repeat(np.arange(n), count)
+            offset = np.arange(len(i)) - np.repeat(np.cumsum(count) - count, count)
+            j = order[np.repeat(first[c], count) + offset]
+            nodes.append(i)
+            deltas.append(pos[i] - pos[j])
+            masses.append(np.where(i != j, mass[j], 0))
+
+    i, delta, pushing_mass = np.concatenate(nodes), np.concatenate(deltas), np.concatenate(masses)
+    distance2 = (delta ** 2).sum(axis=1)
+    scale = np.where(distance2 < 4 * k * k, k * k * pushing_mass / np.maximum(distance2, 1e-4 * k * k), 0)
+    return np.stack([np.bincount(i, delta[:, axis] * scale, minlength=n) for axis in (0, 1)], axis=1)
+
+
+def _forces(pos, src, dst, weight, mass, k, iterations, temperature):
+    """Fruchterman-Reingold iterations with grid repulsion, steps capped by a linearly cooling temperature"""
+    n = len(pos)
+    for step in range(iterations):
+        force = _repulsion(pos, mass, k)
+        # Attraction d^2 / k along the edges, on both ends
+        delta = pos[dst] - pos[src]
+        pull = delta * (np.sqrt((delta ** 2).sum(axis=1)) * weight / k)[:, None]
+        for axis in (0, 1):
+            force[:, axis] += np.bincount(src, pull[:, axis], minlength=n)
+            force[:, axis] -= np.bincount(dst, pull[:, axis], minlength=n)
+        length = np.maximum(np.sqrt((force ** 2).sum(axis=1)), 1e-12)
+        t = temperature * (1 - step / iterations) + 0.01 * k
+        pos = pos + force * (np.minimum(length, t) / length)[:, None]
+    return pos
+
+
+LAYOUT_ENGINES = {"spring": spring_layout, "multilevel": multilevel_layout}
+
+
+def layout_engine(name, n_nodes) -> str:
+    """Engine used for name, "auto": spring layout up to MULTILEVEL_LAYOUT_MIN_NODES nodes"""
+    if name == "auto":
+        return "multilevel" if n_nodes >= MULTILEVEL_LAYOUT_MIN_NODES else "spring"
+    if name not in LAYOUT_ENGINES:
+        raise ValueError(f"Unknown layout engine {name}, expected one of {list(LAYOUT_ENGINES)}")
+    return name
+
+
+if __name__ == "__main__":
+    # Time and edge length / mean distance ratio (lower: tighter drawing) of both engines, on
+    # the bundled ASNR networks and synthetic colonies. Run from the repository root.
+    import time
+    from src.static import GRAPH_DATA
+    from src.loaders.asnr_dataloader import read_asnr_graphml
+
+    def tightness(graph, pos):
+        rng = np.random.default_rng(0)
+        index = {node: i for i, node in enumerate(graph)}
+        points = np.array([pos[node] for node in graph])
+        edges = np.array([(index[u], index[v]) for u, v in graph.edges() if u != v]).reshape(-1, 2)
+        a, b = rng.integers(0, len(points), (2, 20000))
+        return (np.linalg.norm(points[edges[:, 0]] - points[edges[:, 1]], axis=1).mean() /
+                np.linalg.norm(points[a] - points[b], axis=1).mean())
+
+    graphs = [(name, lambda path=animal["path"]: read_asnr_graphml(path))
+              for animals in GRAPH_DATA.values() for name, animal in animals.items()]
+    graphs += [
+        ("barabasi_albert_2000", lambda: nx.barabasi_albert_graph(2000, 2, seed=1)),
+        ("barabasi_albert_10000", lambda: nx.barabasi_albert_graph(10000, 3, seed=1)),
+        ("random_geometric_20000", lambda: nx.random_geometric_graph(20000, 0.012, seed=1)),
+    ]
+    print(f"{'graph':40} {'nodes':>6} {'edges':>7} {'multilevel':>16} {'spring':>16}")
+    for name, read in graphs:
+        graph = read()
+        results = []
+        for engine in ("multilevel", "spring"):
+            if engine == "spring" and graph.order() > 5000:
+                results.append(f"{'(skipped)':>16}")
+                continue
+            start = time.perf_counter()
+            pos = LAYOUT_ENGINES[engine](graph)
+            results.append(f"{time.perf_counter() - start:7.2f}s {tightness(graph, pos):7.3f}")
+        print(f"{name:40} {graph.order():6} {graph.size():7} {results[0]:>16} {results[1]:>16}")
@@ -1,13 +1,21 @@
-from collections import defaultdict
+import logging
+from functools import cached_property
 
 import networkx as nx
 import torch
 import numpy as np
-from sklearn import preprocessing
 
 from matplotlib import cm, colors
 import matplotlib.pyplot as plt
 
+from src.storage.analytics_cache import ANALYTICS_CACHE, graph_fingerprint
+from src.loaders.graphml_cache import GRAPHML_CACHE
+from src.loaders.graphml_stream import UnsupportedGraphML, stream_graphml
+from src.loaders.feature_encoder import FeatureEncoder
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('asnr_dataloader')
+
 shades = plt.get_cmap("Pastel1")
 random_state = np.random.RandomState(42)
 
@@ -21,34 +29,53 @@ def name_2_id(g):
     return node_dict
 
 
+def clean_node_data(data):
+    """Apply the cleaning rules to the attributes of one node, False if the node must be removed"""
+    if len(data.keys()) in [0, 1]:
+        return False  # Remove nodes with no keys or 1 key
+    vals = data.values()
+    if any(isinstance(val, str) and len(val.strip()) == 0 for val in vals):
+        return False  # Remove nodes with empty strings
+    if any(isinstance(val, str) and val == "-" for val in vals):
+        return False  # some strings have useless spl char, "-"
+    if "tag_id" in data.keys():
+        data.pop("tag_id", None)
+    elif "node" in data.keys():
+        data.pop("node", None)
+    return True
+
+
 def clean_nodes(g):
-    remove_arr = []
-    for node, data in g.nodes(data=True):   
-        if len(data.keys()) in  [0,1]:
-            remove_arr.append(node) # Remove nodes with no keys or 1 key
-        else:
-            vals = data.values()
-            if any(isinstance(val, str) and len(val.strip()) == 0 for val in vals):
-                remove_arr.append(node) # Remove nodes with empty strings 
-            elif any(isinstance(val, str) and val == "-" for val in vals):
-                remove_arr.append(node) # some strings have useless spl char, "-"
-            elif "tag_id" in data.keys():
-                g.nodes[node].pop("tag_id",None)
-            elif "node" in data.keys():
-                g.nodes[node].pop("node",None)
-                # g = g.remove_attribute(tnode=node, attr='tag_id')
-            
+    remove_arr = [node for node, data in g.nodes(data=True) if not clean_node_data(data)]
     [g.remove_node(node) for node in remove_arr]
     return g
 
 
+def read_asnr_graphml(path) -> nx.Graph:
+    """Cleaned graph of a GraphML file, streamed unless the file needs the full networkx reader"""
+    try:
+        return stream_graphml(path, clean=clean_node_data).to_networkx()
+    except UnsupportedGraphML as e:
+        logger.info(f"Cannot stream {path} ({e}), reading it with networkx.")
+        return clean_nodes(nx.read_graphml(path))
+
+
 class ASNRGraph:
     def __init__(self, path=None, graph_obj=None) -> None:
         if graph_obj is None:
-            self.graph = clean_nodes(nx.read_graphml(path))
+            # Parsed once per file version, see GraphMLCache
+            self.graph = GRAPHML_CACHE.load(path, read=read_asnr_graphml)
         else:
             self.graph = graph_obj
-        self.colors, self.centrality = self._init_colors()
+        # Note: colors and centrality are computed on first access only
+
+    @cached_property
+    def colors(self):
+        return self._init_colors()
+
+    @cached_property
+    def centrality(self):
+        return self._init_centrality()
 
     def _init_colors(self):
         g = self.graph
@@ -65,65 +92,48 @@ class ASNRGraph:
         for node, degree in g.degree():
             node_color[node] = mapper.to_rgba(degree)
         color_dict = {"node": node_color, "edge": edge_color}
-        centrality_dict = {
-            "betweeness": nx.betweenness_centrality(g),
-            "closeness": nx.closeness_centrality(g),
-            # "eigenvector": nx.eigenvector_centrality(g), # NOTE: Some graphs in the dataset don't converge and cause an error
-            "degree": nx.degree_centrality(g),
-        }
-        return color_dict, centrality_dict
-
-    def preprocess(self):
-        node_dict = name_2_id(self.graph)
+        return color_dict
 
-        # 3. Encode the string names  by label encoders
-        keys2val_str = defaultdict(lambda: {"list": []})
-        for node, data in self.graph.nodes(data=True):
-            for key, val in data.items():
-                keys2val_str[key]["list"].append(val)
+    def _init_centrality(self):
+        g = self.graph
+        centrality_dict = ANALYTICS_CACHE.get_or_compute(
+            graph_fingerprint(g), "centrality", lambda: {
+                "betweeness": nx.betweenness_centrality(g),
+                "closeness": nx.closeness_centrality(g),
+                # "eigenvector": nx.eigenvector_centrality(g), # NOTE: Some graphs in the dataset don't converge and cause an error
+                "degree": nx.degree_centrality(g),
+            })
+        return centrality_dict
+
+    def preprocess(self, encoder: FeatureEncoder = None):
+        """
+        (feat, edgelist, adj, node_dict, features), the model inputs.
+
+        Node attributes are encoded by encoder, e.g. the one saved with a trained model, or by
+        a new one fitted on this graph. The encoder used is kept in self.feature_encoder.
+        feat and edgelist are built from whole arrays.
+        """
+        node_dict = name_2_id(self.graph)
+        nodes = list(self.graph.nodes(data=True))
 
-        # 3.1 Declare Label Encoder objects
-        for key, value in keys2val_str.items():
-            le = preprocessing.LabelEncoder()
-            list_of_vals = list(set(value["list"]))
-            le.fit(list_of_vals)
-            keys2val_str[key]["le"] = le
+        # 3. Encode the string names  by label encoders, see FeatureEncoder
+        if encoder is None:
+            encoder = FeatureEncoder.fit([data for _, data in nodes])
+        self.feature_encoder = encoder
 
-        # print(keys2val_str)
         ## 4. Collating node features ###
-        nodes_size = len(node_dict)
-
-        for node, data in self.graph.nodes(data=True):
-            feat_size = len([value for _, value in data.items()])
-            break
-
-        feat = torch.zeros(nodes_size, feat_size)
-
-        i = 0
-        for node, data in self.graph.nodes(data=True):
-            f = []
-            for key, val in data.items():
-                if isinstance(val, str):
-                    le = keys2val_str[key]["le"]
-                    f.append(le.transform([data[key]])[0])
-                else:
-                    f.append(val)
-            f = torch.Tensor(f)
-            feat[i] = f
-            i += 1
+        feat = encoder.transform(nodes)
 
         ## 5. Collating edge features ###
-        edgelist = torch.zeros(self.graph.number_of_edges(), 2)
-
-        i = 0
-        for u, v, data in self.graph.edges(data=True):
-            edgelist[i] = torch.Tensor([node_dict[u], node_dict[v]])
-            i += 1
+        # Note: same order as graph.edges, walking the adjacency dicts directly
+        pairs, seen = [], set()
+        for u, neighbors in self.graph._adj.items():
+            pairs.extend((node_dict[u], node_dict[v]) for v in neighbors if v not in seen)
+            seen.add(u)
+        edgelist = torch.from_numpy(np.array(pairs, dtype=np.float32).reshape(-1, 2))
         adj = nx.adjacency_matrix(self.graph)
 
-        features = {}
-        for node, data in self.graph.nodes(data=True):
-            features[node] = data
+        features = {node: data for node, data in self.graph.nodes(data=True)}
         return feat, edgelist, adj, node_dict, features
 
     def graph(self):
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import os
+import json
+from collections import defaultdict
+
+import numpy as np
+import torch
+from sklearn import preprocessing
+
+FORMAT_VERSION = 1
+
+
+def encoder_path(model_path):
+    """Feature encoder saved next to a model, results/models/model_<animal>_<version>.features.json"""
+    return os.path.splitext(model_path)[0] + ".features.json"
+
+
+class FeatureEncoder:
+    """
+    Node attributes -> feature matrix of the graph auto-encoder.
+
+    - columns: the feature schema, attribute keys of the first node at fit time. Column j of
+      a row is the value of the attribute columns[j] of its node, 0 if the node does not have
+      it; attributes outside the schema are ignored.
+    - classes: sorted labels of every attribute with string values. A string is encoded by
+      its label index; strings unseen at fit time get len(classes), known codes never shift.
+
+    The encoder fitted for training is saved next to the model, so inference encodes nodes
+    the way the weights were trained. Encoded rows are remembered per node and reused while
+    the attributes of the node stay the same.
+    """
+
+    def __init__(self, columns=None, classes=None):
+        self.columns = list(columns or [])
+        self.classes = {key: np.asarray(labels, dtype=np.str_) for key, labels in (classes or {}).items()}
+        self._rows = {}  # node -> (attributes, encoded row)
+
+    @classmethod
+    def fit(cls, records) -> FeatureEncoder:
+        """Encoder of a list of node attribute dicts, one label encoder per string attribute"""
+        values = defaultdict(list)
+        for data in records:
+            for key, val in data.items():
+                values[key].append(val)
+        classes = {}
+        for key, column in values.items():
+            if any(isinstance(val, str) for val in column):
+                le = preprocessing.LabelEncoder()
+                le.fit(list(set(column)))
+                classes[key] = le.classes_
+        return cls(columns=list(records[0]), classes=classes)
+
+    # =====================================================
+    # Encoding
+    # =====================================================
+
+    def transform(self, nodes) -> torch.Tensor:
+        """float32 feature matrix of (node, attributes) pairs, only new or edited nodes are encoded"""
+        feat = np.zeros((len(nodes), len(self.columns)), dtype=np.float32)
+        stale = []
+        for i, (node, data) in enumerate(nodes):
+            cached = self._rows.get(node)
+            if cached is not None and cached[0] == data:
+                feat[i] = cached[1]
+            else:
+                stale.append(i)
+
+        # Note: columns follow the schema, not the key order of each node, missing keys stay 0
+        for j, key in enumerate(self.columns):
+            rows = [i for i in stale if nodes[i][1].get(key) is not None]
+            if rows:
+                feat[rows, j] = self.encode_column(key, [nodes[i][1][key] for i in rows])
+        for i in stale:
+            node, data = nodes[i]
+            self._rows[node] = (dict(data), feat[i].copy())
+        return torch.from_numpy(feat)
+
+    def encode_column(self, key, values) -> np.ndarray:
+        """float64 column of values of the attribute key, strings replaced by their label"""
+        is_str = np.fromiter((isinstance(val, str) for val in values), dtype=bool, count=len(values))
+        if not is_str.any():
+            return np.array(values, dtype=np.float64)
+        column = np.empty(len(values))
+        strings = values if is_str.all() else [val for val, s in zip(values, is_str) if s]
+        column[is_str] = self._labels(key, strings)
+        if not is_str.all():
+            column[~is_str] = [val for val, s in zip(values, is_str) if not s]
+        return column
+
+    def _labels(self, key, strings) -> np.ndarray:
+        classes = self.classes.get(key, np.zeros(0, dtype=np.str_))
+        strings = np.asarray(strings, dtype=np.str_)
+        labels = np.searchsorted(classes, strings)
+        known = labels < len(classes)
+        known[known] = classes[labels[known]] == strings[known]
+        labels[~known] = len(classes)
+        return labels
+
+    # =====================================================
+    # Persistence
+    # =====================================================
+
+    def save(self, path):
+        spec = {
+            "format": FORMAT_VERSION,
+            "columns": self.columns,
+            "classes": {key: labels.tolist() for key, labels in self.classes.items()},
+        }
+        with open(path, "w") as f:
+            json.dump(spec, f)
+
+    @classmethod
+    def load(cls, path) -> FeatureEncoder:
+        with open(path) as f:
+            spec = json.load(f)
+        return cls(columns=spec["columns"], classes=spec["classes"])
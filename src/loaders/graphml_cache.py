@@ -0,0 +1,79 @@
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import networkx as nx
+
+from src.static import CACHE_FOLDER
+from src.storage.columnar import ColumnarGraph, save_columnar
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('graphml_cache')
+
+
+class GraphMLCache:
+    """
+    Parsed and cleaned GraphML files.
+
+    The cleaned graph of a file is written once in the columnar format to
+    <folder>/<hash of the path>.npz, together with the modification time and size of the
+    source, and is reused until the source changes. The last `memo_size` graphs are also
+    kept in memory. Callers always get their own copy, also from worker threads.
+    """
+
+    def __init__(self, folder=os.path.join(CACHE_FOLDER, "graphml"), memo_size=8):
+        self.folder = folder
+        self.memo_size = memo_size
+        self._memo = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _cache_path(self, path):
+        return os.path.join(self.folder, hashlib.sha1(os.path.abspath(path).encode()).hexdigest() + ".npz")
+
+    def load(self, path, read) -> nx.Graph:
+        """Graph of the GraphML file at path, as parsed and cleaned by read(path)"""
+        with self._lock:
+            return self._load(path, read)
+
+    def _load(self, path, read) -> nx.Graph:
+        stat = os.stat(path)
+        source = {"path": os.path.abspath(path), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+        key = tuple(source.values())
+        if key in self._memo:
+            self._memo.move_to_end(key)
+            return self._memo[key].copy()
+
+        graph = self._read_cached(path, source)
+        if graph is None:
+            graph = read(path)
+            self._write_cached(path, source, graph)
+
+        self._memo[key] = graph
+        if len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+        return graph.copy()
+
+    def _read_cached(self, path, source):
+        cache_path = self._cache_path(path)
+        if not os.path.isfile(cache_path):
+            return None
+        columns = ColumnarGraph(cache_path)
+        if columns.meta.get("source") != source:
+            return None
+        logger.info(f"Loaded parsed {path} from cache.")
+        return columns.to_networkx()
+
+    def _write_cached(self, path, source, graph):
+        if graph.is_directed() or graph.is_multigraph():
+            # Note: the columnar format only holds simple undirected graphs
+            return
+        cache_path = self._cache_path(path)
+        os.makedirs(self.folder, exist_ok=True)
+        with open(cache_path + ".tmp", "wb") as f:
+            save_columnar(f, graph, meta={"source": source})
+        os.replace(cache_path + ".tmp", cache_path)
+
+
+GRAPHML_CACHE = GraphMLCache()
@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import logging
+from array import array
+from xml.etree.ElementTree import Element, iterparse
+
+import numpy as np
+from networkx.readwrite.graphml import GraphMLReader
+
+from src.storage.csr import CSRCore, _column
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('graphml_stream')
+
+
+class UnsupportedGraphML(ValueError):
+    """The file uses GraphML features only nx.read_graphml handles"""
+
+
+def stream_graphml(path, clean=None):
+    """
+    Read an undirected GraphML file into a CSRCore without building its document tree.
+
+    Each node and edge element is decoded when the parser reaches its end tag and is then
+    dropped. `clean(data)` gets the attributes of every node, may edit them in place and
+    returns False if the node must be removed, so removed nodes are never stored. Edges
+    are kept as int arrays and per-attribute columns until the end of the file.
+
+    The result holds the same graph as nx.read_graphml followed by the cleaning, in the
+    same node and edge order. Directed graphs, parallel edges, hyperedges, ports and nested
+    graphs raise UnsupportedGraphML.
+    """
+    reader = GraphMLReader()
+    key_tag, graph_tag, node_tag, edge_tag, data_tag = (
+        f"{{{reader.NS_GRAPHML}}}{name}" for name in ("key", "graph", "node", "edge", "data"))
+    unsupported_tags = {f"{{{reader.NS_GRAPHML}}}{name}" for name in ("hyperedge", "port")}
+
+    key_elements, graph_data = Element("graphml"), Element("graph")
+    keys = defaults = graph_xml = None
+    stack = []
+
+    nodes = {}  # name -> index among kept nodes, -1 for removed ones
+    names, records = [], []
+    codes = {}  # name -> code, for every edge endpoint
+    src, dst = array("q"), array("q")
+    edge_values = {}  # key -> (values, edge numbers)
+
+    for event, elem in iterparse(path, events=("start", "end")):
+        if event == "start":
+            if elem.tag in unsupported_tags:
+                raise UnsupportedGraphML(f"{elem.tag} elements")
+            if elem.tag == graph_tag:
+                if graph_xml is not None:
+                    raise UnsupportedGraphML("nested graphs")
+                if elem.get("edgedefault") == "directed":
+                    raise UnsupportedGraphML("directed graph")
+                graph_xml = elem
+                keys, defaults = reader.find_graphml_keys(key_elements)
+            stack.append(elem.tag)
+            continue
+
+        stack.pop()
+        parent = stack[-1] if stack else None
+        if elem.tag == key_tag:
+            if keys is not None:
+                raise UnsupportedGraphML("keys declared after the graph")
+            key_elements.append(elem)
+        elif elem.tag == graph_tag:
+            # Note: like nx.read_graphml, only the first graph of the file is read
+            break
+        elif parent != graph_tag:
+            continue
+        elif elem.tag == data_tag:
+            graph_data.append(elem)
+        elif elem.tag == node_tag:
+            name = str(elem.get("id"))
+            if name in nodes:
+                raise UnsupportedGraphML(f"node {name} declared twice")
+            # Decoded elements are dropped from the partial tree right away
+            data = reader.decode_data_elements(keys, elem)
+            if clean is None or clean(data):
+                nodes[name] = len(names)
+                names.append(name)
+                records.append(data)
+            else:
+                nodes[name] = -1
+            graph_xml.remove(elem)
+        elif elem.tag == edge_tag:
+            if elem.get("directed") == "true":
+                raise UnsupportedGraphML("directed edges")
+            data = reader.decode_data_elements(keys, elem)
+            if elem.get("id"):
+                data["id"] = elem.get("id")
+            for key, value in data.items():
+                if key not in edge_values:
+                    edge_values[key] = ([], array("q"))
+                edge_values[key][0].append(value)
+                edge_values[key][1].append(len(src))
+            src.append(codes.setdefault(str(elem.get("source")), len(codes)))
+            dst.append(codes.setdefault(str(elem.get("target")), len(codes)))
+            graph_xml.remove(elem)
+
+    if graph_xml is None:
+        raise UnsupportedGraphML("no graph element")
+
+    src, dst = np.frombuffer(src, dtype=np.int64), np.frombuffer(dst, dtype=np.int64)
+    n_codes = len(codes)
+    edge_keys = np.minimum(src, dst) * n_codes + np.maximum(src, dst)
+    if np.unique(edge_keys).size < edge_keys.size:
+        raise UnsupportedGraphML("parallel edges")
+
+    # Endpoints without a node element have no attributes: the cleaning removes them,
+    # otherwise they follow the declared nodes, in the order of the edges
+    position = np.full(n_codes, -1, dtype=np.int64)
+    for name, code in codes.items():
+        if name not in nodes and clean is None:
+            nodes[name] = len(names)
+            names.append(name)
+            records.append({})
+        position[code] = nodes.get(name, -1)
+    pu, pv = position[src], position[dst]
+    kept = np.flatnonzero((pu >= 0) & (pv >= 0))
+    first, second = np.minimum(pu, pv)[kept], np.maximum(pu, pv)[kept]
+    # Note: nx.Graph(multigraph) adds each edge while visiting its first endpoint in node
+    # order, edges of that endpoint in file order, which sets the adjacency order
+    order = np.lexsort((kept, first))
+
+    core = CSRCore()
+    core.names, core.index = names, {name: i for i, name in enumerate(names)}
+    core.node_columns = CSRCore._columns(records)
+    core.src, core.dst = first[order], second[order]
+    row = np.full(len(src), -1, dtype=np.int64)
+    row[kept[order]] = np.arange(len(order))
+    for key, (values, numbers) in edge_values.items():
+        rows = row[np.frombuffer(numbers, dtype=np.int64)]
+        column, present = [None] * len(order), [False] * len(order)
+        for i, value in zip(rows.tolist(), values):
+            if i >= 0:
+                column[i], present[i] = value, True
+        if any(present):
+            core.edge_columns[key] = _column(column, present)
+
+    core.graph_attrs = {"node_default": {}, "edge_default": {}}
+    for key_id, value in defaults.items():
+        key_for = keys[key_id]["for"]
+        if key_for in ("node", "edge"):
+            core.graph_attrs[f"{key_for}_default"][keys[key_id]["name"]] = keys[key_id]["type"](value)
+    core.graph_attrs.update(reader.decode_data_elements(keys, graph_data))
+    return core
+
+
+if __name__ == "__main__":
+    # Load time and peak RSS of the streaming reader against nx.read_graphml + clean_nodes,
+    # each run in a fresh interpreter on a synthetic proximity network
+    import os
+    import sys
+    import json
+    import time
+    import tempfile
+    import subprocess
+
+    if len(sys.argv) == 3:
+        import networkx as nx
+        from src.loaders.asnr_dataloader import clean_nodes, clean_node_data
+
+        def status(field):
+            with open("/proc/self/status") as f:
+                return next(int(line.split()[1]) * 1024 for line in f if line.startswith(field))
+
+        mode, path = sys.argv[1:]
+        # Note: resets the peak RSS of the process (Linux), imports are not counted
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        baseline = status("VmRSS")
+        start = time.perf_counter()
+        if mode == "networkx":
+            graph = clean_nodes(nx.read_graphml(path))
+        elif mode == "stream":
+            graph = stream_graphml(path, clean=clean_node_data).to_networkx()
+        else:
+            graph = stream_graphml(path, clean=clean_node_data)
+        seconds = time.perf_counter() - start
+        peak = status("VmHWM") - baseline
+        print(json.dumps({"seconds": seconds, "peak_mb": peak / 1e6}))
+        sys.exit()
+
+    import networkx as nx
+
+    rng = np.random.default_rng(0)
+    n_nodes, n_edges = 20000, 1000000
+    path = os.path.join(tempfile.mkdtemp(), "proximity.graphml")
+    g = nx.Graph()
+    for i in range(n_nodes):
+        g.add_node(f"ant_{i}", tag_id=i, group=str(rng.choice(["nurse", "forager", "-"], p=[.5, .45, .05])),
+                   body_size=float(rng.random()))
+    g.add_edges_from((f"ant_{u}", f"ant_{v}", {"weight": float(w)}) for u, v, w in zip(
+        rng.integers(0, n_nodes, n_edges), rng.integers(0, n_nodes, n_edges), rng.integers(1, 100, n_edges)))
+    nx.write_graphml(g, path)
+    print(f"{path}: {g.number_of_nodes()} nodes, {g.number_of_edges()} edges, "
+          f"{os.path.getsize(path) / 1e6:.0f} MB")
+
+    for mode, label in (("networkx", "nx.read_graphml + clean_nodes"),
+                        ("stream", "streaming reader, to networkx"),
+                        ("core", "streaming reader, CSRCore only")):
+        output = subprocess.run([sys.executable, "-m", "src.loaders.graphml_stream", mode, path],
+                                capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{label:32s} {result['seconds']:6.2f}s  peak RSS +{result['peak_mb']:.0f} MB")
@@ -0,0 +1,393 @@
+import logging
+from collections import deque
+
+import networkx as nx
+
+from .storage.analytics_cache import ANALYTICS_CACHE, graph_fingerprint
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('metrics')
+
+
+class MetricEngine:
+    """
+    Computes metrics of a networkx graph on demand and memoizes them.
+
+    Every metric is computed at most once per graph state. Edits made through
+    add_nodes_from / add_edges_from / remove_nodes_from / remove_edges_from are applied
+    incrementally: degree and triangle tables are patched in O(deg) per edit, and
+    betweenness / closeness are only recomputed for the connected components touched
+    by an edit. The node and edge counts are kept up to date by these edits instead of
+    being counted again (networkx counts edges in O(N)). invalidate(), which the owning
+    Graph connects to its graph_updated signal, drops the memoized results and picks up
+    nodes added or removed behind the back of the engine; other changes of the graph
+    must be followed by reset().
+
+    Metrics computed from scratch are also stored in the persistent ANALYTICS_CACHE,
+    keyed by the fingerprint of the graph, so reopening an unchanged graph is instant.
+    """
+
+    # Node level metrics, shown in the side bars as "Centrality Metrics"
+    CENTRALITIES = ["betweeness", "closeness", "degree"]
+    # "eigenvector" is left out, it does not converge on some graphs of the dataset
+
+    def __init__(self, graph: nx.Graph):
+        self.graph = graph
+        self._cache = {}
+        self.reset()
+
+    def reset(self):
+        """Forget all maintained tables, they are rebuilt from scratch on next read"""
+        self._cache = {}
+        self._degree = None
+        self._triangles = None
+        self._betweenness = None  # unnormalized, per connected component
+        self._closeness = None  # (size of reachable set, sum of distances) per node
+        self._dirty = set()  # nodes whose component needs betweenness/closeness again
+        self._n_nodes, self._n_edges = self.graph.number_of_nodes(), self.graph.number_of_edges()
+
+    def invalidate(self):
+        """Drop memoized results, and the maintained tables if nodes changed behind our back"""
+        self._cache = {}
+        if self._n_nodes != self.graph.number_of_nodes():
+            logger.info("Graph changed outside of the metric engine, recomputing metrics.")
+            self.reset()
+
+    def get(self, name, func):
+        """Return metric `name`, computing it with func() if not memoized yet"""
+        if name not in self._cache:
+            self._cache[name] = func()
+        return self._cache[name]
+
+    @property
+    def incremental(self):
+        return not (self.graph.is_directed() or self.graph.is_multigraph())
+
+    @property
+    def n_edges(self) -> int:
+        """Number of edges, in O(1)"""
+        return self._n_edges
+
+    @property
+    def fingerprint(self) -> str:
+        return self.get("fingerprint", lambda: graph_fingerprint(self.graph))
+
+    def _cached(self, name, func):
+        """Load a metric of the current graph from disk, or compute and store it"""
+        return ANALYTICS_CACHE.get_or_compute(self.fingerprint, name, func)
+
+    # =====================================================
+    # Metrics
+    # =====================================================
+
+    @property
+    def centrality_dict(self) -> dict:
+        return {
+            "betweeness": self.get("betweeness", self._betweenness_centrality),
+            "closeness": self.get("closeness", self._closeness_centrality),
+            "degree": self.get("degree", self._degree_centrality),
+        }
+
+    @property
+    def degrees(self) -> dict:
+        if not self.incremental:
+            return self.get("degrees", lambda: dict(self.graph.degree()))
+        if self._degree is None:
+            self._degree = dict(self.graph.degree())
+        return self._degree
+
+    @property
+    def avg_clustering(self) -> float:
+        return self.get("avg_clustering", self._avg_clustering)
+
+    def _degree_centrality(self):
+        if len(self.graph) <= 1:
+            return {n: 1 for n in self.graph}
+        s = 1.0 / (len(self.graph) - 1.0)
+        return {n: d * s for n, d in self.degrees.items()}
+
+    def _avg_clustering(self):
+        if not self.incremental:
+            return self._cached("avg_clustering", lambda: nx.average_clustering(G=self.graph))
+        if self._triangles is None:
+            self._triangles = self._cached("triangles", lambda: nx.triangles(self.graph))
+        adj = self.graph.adj
+        coeffs = []
+        for node, nbrs in adj.items():
+            d = len(nbrs) - (node in nbrs)  # self-loops do not count for clustering
+            t = 2 * self._triangles[node]
+            coeffs.append(0 if t == 0 else t / (d * (d - 1)))
+        return sum(coeffs) / len(coeffs)
+
+    def _betweenness_centrality(self):
+        if not self.incremental:
+            return self._cached("betweeness", lambda: nx.betweenness_centrality(self.graph))
+        self._refresh_components()
+        if self._betweenness is None:
+            self._betweenness = self._cached("raw_betweeness",
+                                             lambda: self._raw_betweenness(self.graph))
+        n = len(self.graph)
+        if n <= 2:
+            return dict(self._betweenness)
+        scale = 1 / ((n - 1) * (n - 2))
+        return {node: value * scale for node, value in self._betweenness.items()}
+
+    def _closeness_centrality(self):
+        if not self.incremental:
+            return self._cached("closeness", lambda: nx.closeness_centrality(self.graph))
+        self._refresh_components()
+        if self._closeness is None:
+            self._closeness = self._cached("raw_closeness",
+                                           lambda: self._raw_closeness(self.graph))
+        len_G = len(self.graph)
+        closeness = {}
+        for node, (reachable, totsp) in self._closeness.items():
+            value = 0.0
+            if totsp > 0.0 and len_G > 1:
+                value = (reachable - 1.0) / totsp
+                value *= (reachable - 1.0) / (len_G - 1)
+            closeness[node] = value
+        return closeness
+
+    # =====================================================
+    # Per component recomputation
+    # =====================================================
+
+    @staticmethod
+    def _raw_betweenness(graph):
+        # Summed over ordered (s, t) pairs, as networkx does before rescaling
+        raw = nx.betweenness_centrality(graph, normalized=False)
+        return {node: 2 * value for node, value in raw.items()}
+
+    @staticmethod
+    def _raw_closeness(graph):
+        closeness = {}
+        for node in graph:
+            sp = nx.single_source_shortest_path_length(graph, node)
+            closeness[node] = (len(sp), sum(sp.values()))
+        return closeness
+
+    def _refresh_components(self):
+        """Recompute betweenness and closeness of components touched since last read"""
+        if not self._dirty:
+            return
+        done = set()
+        for node in self._dirty:
+            if node in done or node not in self.graph:
+                continue
+            component = nx.node_connected_component(self.graph, node)
+            done |= component
+            if len(component) == len(self.graph):
+                subgraph = self.graph
+            else:
+                # Note: a copy, algorithms are much slower on filtered subgraph views
+                subgraph = self.graph.subgraph(component).copy()
+            if self._betweenness is not None:
+                self._betweenness.update(self._raw_betweenness(subgraph))
+            if self._closeness is not None:
+                self._closeness.update(self._raw_closeness(subgraph))
+        self._dirty = set()
+
+    # =====================================================
+    # Incremental edits
+    # =====================================================
+
+    def add_nodes_from(self, nodes):
+        if not self.incremental:
+            self.graph.add_nodes_from(nodes)
+            return self.reset()
+        for node in nodes:
+            name = node[0] if isinstance(node, tuple) else node
+            is_new = name not in self.graph
+            self.graph.add_nodes_from([node])
+            if is_new:
+                self._node_added(name)
+        self._edited()
+
+    def add_edges_from(self, edges):
+        if not self.incremental:
+            self.graph.add_edges_from(edges)
+            return self.reset()
+        for edge in edges:
+            u, v = edge[0], edge[1]
+            for node in (u, v):
+                if node not in self.graph:
+                    self.graph.add_node(node)
+                    self._node_added(node)
+            if self.graph.has_edge(u, v):
+                self.graph.add_edges_from([edge])  # only updates edge data
+                continue
+            self._patch_triangles(u, v, +1)
+            plan = self._plan_centralities(u, v, inserted=True)
+            self.graph.add_edges_from([edge])
+            self._n_edges += 1
+            self._patch_degrees(u, v, +1)
+            self._apply_centralities(plan)
+        self._edited()
+
+    def remove_edges_from(self, edges):
+        if not self.incremental:
+            self.graph.remove_edges_from(edges)
+            return self.reset()
+        for edge in edges:
+            self._remove_edge(edge[0], edge[1])
+        self._edited()
+
+    def remove_nodes_from(self, nodes):
+        if not self.incremental:
+            self.graph.remove_nodes_from(nodes)
+            return self.reset()
+        for node in nodes:
+            if node not in self.graph:
+                continue
+            for nbr in list(self.graph.adj[node]):
+                self._remove_edge(node, nbr)
+            self.graph.remove_node(node)
+            self._n_nodes -= 1
+            for table in (self._degree, self._triangles, self._betweenness, self._closeness):
+                if table is not None:
+                    table.pop(node, None)
+        self._edited()
+
+    def _remove_edge(self, u, v):
+        if not self.graph.has_edge(u, v):
+            return
+        plan = self._plan_centralities(u, v, inserted=False)
+        self.graph.remove_edge(u, v)
+        self._n_edges -= 1
+        self._patch_triangles(u, v, -1)
+        self._patch_degrees(u, v, -1)
+        self._apply_centralities(plan)
+
+    def _node_added(self, node):
+        self._n_nodes += 1
+        if self._degree is not None:
+            self._degree[node] = 0
+        if self._triangles is not None:
+            self._triangles[node] = 0
+        if self._betweenness is not None:
+            self._betweenness[node] = 0.0
+        if self._closeness is not None:
+            self._closeness[node] = (1, 0)
+
+    def _patch_degrees(self, u, v, sign):
+        if self._degree is not None:
+            self._degree[u] += sign
+            self._degree[v] += sign  # a self-loop counts twice, as in networkx
+
+    def _patch_triangles(self, u, v, sign):
+        """Edge u-v closes (or opens) one triangle with every common neighbour"""
+        if self._triangles is None or u == v:
+            return
+        adj = self.graph.adj
+        small, large = sorted((adj[u], adj[v]), key=len)
+        common = [w for w in small if w in large and w != u and w != v]
+        self._triangles[u] += sign * len(common)
+        self._triangles[v] += sign * len(common)
+        for w in common:
+            self._triangles[w] += sign
+
+    def _edited(self):
+        self._cache = {}
+
+    # =====================================================
+    # Dynamic betweenness / closeness
+    # =====================================================
+
+    def _plan_centralities(self, u, v, inserted):
+        """
+        Decide, before edge u-v is inserted or removed, how to update the centralities.
+
+        Shortest paths from a source s can only use edge u-v if d(s, u) != d(s, v), so only
+        those sources have to be recomputed. A leaf joining or leaving a component is
+        handled in closed form from the dependencies of its single neighbour.
+        """
+        if (self._betweenness is None and self._closeness is None) or u == v:
+            return None
+        if self._dirty:
+            # Components are already waiting for a recompute, let them absorb this edit too
+            self._dirty.update((u, v))
+            return None
+
+        du = nx.single_source_shortest_path_length(self.graph, u)
+        dv = nx.single_source_shortest_path_length(self.graph, v)
+        for leaf, hub, d_hub in ((v, u, du), (u, v, dv)):
+            leaf_degree = len(self.graph.adj[leaf]) - (leaf in self.graph.adj[leaf])
+            if leaf_degree == (0 if inserted else 1) and len(d_hub) > (1 if inserted else 2):
+                return "leaf", leaf, hub, d_hub, inserted
+
+        reachable = du.keys() | dv.keys()
+        sources = [s for s in reachable if du.get(s) != dv.get(s)]
+        if 2 * len(sources) > len(reachable):
+            # Cheaper to recompute the whole component once
+            self._dirty.update((u, v))
+            return None
+        if inserted:
+            # Insertion changes distances only if they differed by more than one
+            moved = [s for s in sources if abs(du.get(s, -len(reachable)) - dv.get(s, -len(reachable))) > 1]
+        else:
+            moved = sources
+        if self._betweenness is not None:
+            for s in sources:
+                for node, delta in self._dependencies(s).items():
+                    self._betweenness[node] -= delta
+        return "sources", sources, moved
+
+    def _apply_centralities(self, plan):
+        if plan is None:
+            return
+        if plan[0] == "leaf":
+            return self._apply_leaf(*plan[1:])
+        _, sources, moved = plan
+        if self._betweenness is not None:
+            for s in sources:
+                for node, delta in self._dependencies(s).items():
+                    self._betweenness[node] += delta
+        if self._closeness is not None:
+            for s in moved:
+                sp = nx.single_source_shortest_path_length(self.graph, s)
+                self._closeness[s] = (len(sp), sum(sp.values()))
+
+    def _apply_leaf(self, leaf, hub, d_hub, inserted):
+        # Every path between the leaf and the rest of its component goes through the hub,
+        # so each of them adds the dependencies of the hub as a source, in both directions.
+        sign = 1 if inserted else -1
+        others = [node for node in d_hub if node != leaf]
+        if self._betweenness is not None:
+            for node, delta in self._dependencies(hub).items():
+                self._betweenness[node] += sign * 2 * delta
+            self._betweenness[hub] += sign * 2 * (len(others) - 1)
+            self._betweenness[leaf] = 0.0
+        if self._closeness is not None:
+            for node in others:
+                reachable, totsp = self._closeness[node]
+                self._closeness[node] = (reachable + sign, totsp + sign * (d_hub[node] + 1))
+            if inserted:
+                self._closeness[leaf] = (len(others) + 1, sum(d_hub.values()) + len(others))
+            else:
+                self._closeness[leaf] = (1, 0)
+
+    def _dependencies(self, s):
+        """Brandes' single source dependencies of all nodes on source s (unweighted)"""
+        adj = self.graph.adj
+        order, preds, sigma, dist = [], {s: []}, {s: 1}, {s: 0}
+        queue = deque([s])
+        while queue:
+            v = queue.popleft()
+            order.append(v)
+            for w in adj[v]:
+                if w not in dist:
+                    queue.append(w)
+                    dist[w] = dist[v] + 1
+                    sigma[w] = 0
+                    preds[w] = []
+                if dist[w] == dist[v] + 1:
+                    sigma[w] += sigma[v]
+                    preds[w].append(v)
+        delta = dict.fromkeys(order, 0)
+        for w in reversed(order):
+            coeff = (1 + delta[w]) / sigma[w]
+            for v in preds[w]:
+                delta[v] += sigma[v] * coeff
+        delta.pop(s)
+        return delta
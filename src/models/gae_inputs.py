@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import logging
+import numpy as np
+import networkx as nx
+import scipy.sparse as sp
+
+from src.loaders.feature_encoder import FeatureEncoder
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('gae_inputs')
+
+
+def _weight(data):
+    # Note: same weights as nx.adjacency_matrix, which the model was trained on
+    return data.get("weight", 1)
+
+
+class GAEInputs:
+    """
+    Inputs and embeddings of the graph auto-encoder for one graph, kept in memory and patched
+    when nodes or edges are added, so predicting links for a new node costs time in the size
+    of the edited neighbourhoods instead of the whole graph.
+
+    For the bound model (weights W1, W2 of its first two graph convolutions) it keeps, rows in
+    node order:
+    - X, node features encoded by the FeatureEncoder of the model
+    - degree, weighted degrees + 1: the diagonal of the symmetric normalization
+      Â = D^-1/2 (A + I) D^-1/2 (see preprocess_graph), whose rows are read from the graph
+      adjacency when needed
+    - S1 = X W1, H1 = relu(Â S1), S2 = H1 W2 and mu = Â S2, the embedding of the encoder
+
+    An edit of node u changes degree[u], so row u of Â and the entries (x, u) of its
+    neighbours: H1 is recomputed on the closed neighbourhood of u and mu one hop further,
+    when the embedding is next read. Node removals, and nodes added or removed behind its
+    back, rebuild everything on next use. Edges must be edited through edited(): they are
+    not counted again, networkx counts them in O(N).
+    """
+
+    def __init__(self, graph: nx.Graph):
+        self.graph = graph
+        self.model_key = None
+        self.encoder = None
+
+    @property
+    def bound(self):
+        return self.model_key is not None and self._n_nodes == self.graph.number_of_nodes()
+
+    def bind(self, key, weights, encoder: FeatureEncoder = None):
+        """
+        Use the model identified by key (e.g. its path and modification time), with the
+        (W1, W2) weights and its feature encoder. Rebuilds everything if the model changed.
+        A new encoder is fitted on the graph if the model was saved without one.
+        """
+        if key == self.model_key and self.bound:
+            return
+        self.model_key = key
+        self.W1, self.W2 = (np.asarray(w, dtype=np.float32) for w in weights)
+        self.encoder = encoder or FeatureEncoder.fit([data for _, data in self.graph.nodes(data=True)])
+        self._build()
+
+    def unbind(self):
+        self.model_key = None
+
+    # =====================================================
+    # Full build
+    # =====================================================
+
+    def _build(self):
+        self.nodes = list(self.graph.nodes)
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        self.X = self.encoder.transform(list(self.graph.nodes(data=True))).numpy()
+        adj = nx.adjacency_matrix(self.graph, nodelist=self.nodes)
+        self.degree = np.asarray(adj.sum(axis=1), dtype=np.float64).ravel() + 1
+        inv_sqrt = sp.diags(self.degree ** -0.5)
+        norm = (inv_sqrt @ (adj + sp.eye(len(self.nodes))) @ inv_sqrt).astype(np.float32).tocsr()
+        self.S1 = self.X @ self.W1
+        self.H1 = np.maximum(norm @ self.S1, 0)
+        self.S2 = self.H1 @ self.W2
+        self.mu = norm @ self.S2
+        self._dirty = set()
+        self._n_nodes = len(self.nodes)
+
+    # =====================================================
+    # Incremental edits
+    # =====================================================
+
+    def edited(self, nodes=(), edges=(), removed=False):
+        """Nodes whose attributes changed or were added, edges added, reweighted or removed"""
+        if self.model_key is None:
+            return
+        if removed or self._n_nodes > self.graph.number_of_nodes():
+            # Note: rows are never deleted, the next bind rebuilds the inputs
+            return self.unbind()
+        new = list(dict.fromkeys(
+            node for node in list(nodes) + [node for edge in edges for node in edge[:2]]
+            if node not in self.index and node in self.graph))
+        self._append(new)
+        edited_nodes = [node for node in nodes if node in self.graph and node not in new]
+        if edited_nodes:
+            rows = [self.index[node] for node in edited_nodes]
+            self.X[rows] = self.encoder.transform(
+                [(node, self.graph.nodes[node]) for node in edited_nodes]).numpy()
+            self.S1[rows] = self.X[rows] @ self.W1
+            self._dirty.update(edited_nodes)
+        for edge in edges:
+            for node in edge[:2]:
+                if node in self.graph:
+                    self.degree[self.index[node]] = sum(map(_weight, self.graph.adj[node].values())) + 1
+                    self._dirty.add(node)
+        self._n_nodes = self.graph.number_of_nodes()
+
+    def _append(self, nodes):
+        if not nodes:
+            return
+        n = len(self.nodes)
+        self.nodes.extend(nodes)
+        self.index.update((node, n + i) for i, node in enumerate(nodes))
+        X = self.encoder.transform([(node, self.graph.nodes[node]) for node in nodes]).numpy()
+        self.X = np.concatenate([self.X, X])
+        self.degree = np.concatenate([self.degree, np.ones(len(nodes))])
+        self.S1 = np.concatenate([self.S1, X @ self.W1])
+        self.H1 = np.concatenate([self.H1, np.zeros((len(nodes), self.H1.shape[1]), dtype=np.float32)])
+        self.S2 = np.concatenate([self.S2, np.zeros((len(nodes), self.S2.shape[1]), dtype=np.float32)])
+        self.mu = np.concatenate([self.mu, np.zeros((len(nodes), self.mu.shape[1]), dtype=np.float32)])
+        self._dirty.update(nodes)
+
+    def _closed_neighbourhood(self, nodes):
+        adj = self.graph.adj
+        return set(nodes).union(*(adj[node] for node in nodes))
+
+    def _norm_row(self, node):
+        """(neighbour rows, Â values) of the row of node, self-loop included"""
+        i = self.index[node]
+        neighbors = self.graph.adj[node]
+        rows = np.fromiter((self.index[nbr] for nbr in neighbors), dtype=np.int64, count=len(neighbors))
+        weights = np.fromiter((_weight(data) for data in neighbors.values()), dtype=np.float64,
+                              count=len(neighbors))
+        if node in neighbors:
+            weights[rows == i] += 1
+        else:
+            rows, weights = np.append(rows, i), np.append(weights, 1.0)
+        values = weights / np.sqrt(self.degree[i] * self.degree[rows])
+        return rows, values.astype(np.float32)
+
+    def _refresh(self):
+        if not self._dirty:
+            return
+        changed = self._closed_neighbourhood(self._dirty)
+        for node in changed:
+            rows, values = self._norm_row(node)
+            i = self.index[node]
+            self.H1[i] = np.maximum(values @ self.S1[rows], 0)
+            self.S2[i] = self.H1[i] @ self.W2
+        for node in self._closed_neighbourhood(changed):
+            rows, values = self._norm_row(node)
+            self.mu[self.index[node]] = values @ self.S2[rows]
+        self._dirty = set()
+
+    # =====================================================
+    # Predictions
+    # =====================================================
+
+    def embedding(self) -> np.ndarray:
+        """mu of every node, rows in node order"""
+        self._refresh()
+        return self.mu
+
+    def link_scores(self, node) -> np.ndarray:
+        """Predicted probability of an edge between node and every node, in node order"""
+        mu = self.embedding()
+        return 1 / (1 + np.exp(-(mu @ mu[self.index[node]])))
@@ -1,10 +1,14 @@
 import os
+import logging
 import torch
-import numpy as np
 from src.models.gae import Encoder, Decoder, GraphAutoEncoder
-from src.utils.gae_utils import preprocess_graph
+from src.models.gae_inputs import GAEInputs
+from src.loaders.feature_encoder import FeatureEncoder, encoder_path
 
-from src.loaders.asnr_dataloader import ASNRGraph
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('inference')
+
+_ENCODERS = {}  # path -> (modification time, FeatureEncoder)
 
 
 def load_model(path, feat_dim):
@@ -22,49 +26,40 @@ def load_model(path, feat_dim):
     return model
 
 
-def sigmoid(x):
-    return 1 / (1 + np.exp(-x))
-
-
-def get_pred_edges(graph, animal, version, new_name):
+def load_feature_encoder(path_to_model):
+    """Encoder saved with the model, read once per file. None for models trained without one."""
+    path = encoder_path(path_to_model)
+    if not os.path.isfile(path):
+        logger.info(f"No feature encoder saved with {path_to_model}, fitting one on the graph.")
+        return None
+    mtime = os.stat(path).st_mtime_ns
+    if path not in _ENCODERS or _ENCODERS[path][0] != mtime:
+        _ENCODERS[path] = (mtime, FeatureEncoder.load(path))
+    return _ENCODERS[path][1]
+
+
+def get_pred_edges(graph, animal, version, new_name, inputs: GAEInputs = None):
+    """
+    Edges predicted between new_name and the other nodes of graph. inputs holds the model
+    inputs of graph across calls (see Graph.model_inputs), so only the neighbourhoods
+    edited since the last prediction are recomputed.
+    """
     save_dir = os.getcwd().split("src")[0] + "/results/models/"
     file_name = "model_{}_{}.pt".format(animal, version)
     path_to_model = os.path.join(save_dir, file_name)
 
-    features, edgelist, adj, node_dict, _ = ASNRGraph(graph_obj=graph).preprocess()
-    n_nodes, feat_dim = features.shape
-    adj_norm = preprocess_graph(adj)
-    model = load_model(path_to_model, feat_dim)
-    model.eval()
-
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    features = features.to(device)
-    adj_norm = adj_norm.to(device)
-    model.to(device)
-
-    _, mu, logvar = model(features, adj_norm)
-    mu = mu.data.cpu().numpy()
-    adj_rec = np.dot(mu, mu.T)
-
-    preds = torch.zeros(adj_rec.shape)
-    for i, row_val in enumerate(adj_rec):
-        for j, col_val in enumerate(adj_rec[i]):
-            preds[i][j] = sigmoid(adj_rec[i][j])
-
-    new_idx = 0
-    for node, data in graph.nodes(data=True):
-        if node == new_name:
-            new_idx = node_dict[node]
-            break
-
-    src_name = [name for name, node_id in node_dict.items() if node_id == new_idx][0]
-    new_edges = []
-    for i, (pred, true) in enumerate(zip(preds[new_idx], adj_norm[new_idx])):
-        if pred >= 0.5:
-            name = [name for name, node_id in node_dict.items() if node_id == i][0]
-
-            if name != src_name:
-                new_edges.append((src_name, name))
-        else:
-            pass
-    return new_edges
+    if inputs is None:
+        inputs = GAEInputs(graph)
+    key = (path_to_model, os.stat(path_to_model).st_mtime_ns)
+    if key != inputs.model_key or not inputs.bound:
+        encoder = load_feature_encoder(path_to_model)
+        feat_dim = len(encoder.columns) if encoder is not None else len(next(iter(graph.nodes.values())))
+        model = load_model(path_to_model, feat_dim)
+        model.eval()
+        weights = (model.encoder.gc1.weight.detach().cpu().numpy(),
+                   model.encoder.gc2.weight.detach().cpu().numpy())
+        inputs.bind(key, weights, encoder)
+
+    preds = inputs.link_scores(new_name)
+    return [(new_name, name) for name, pred in zip(inputs.nodes, preds.tolist())
+            if pred >= 0.5 and name != new_name]
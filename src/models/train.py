@@ -24,6 +24,7 @@ import scipy.sparse as sp
 
 from src.utils.gae_utils import mask_test_edges, preprocess_graph
 from src.models.gae import Encoder, Decoder, GraphAutoEncoder
+from src.loaders.feature_encoder import encoder_path
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 n_epochs = 100
@@ -72,7 +73,7 @@ def get_preprocessed_adj(adj, features):
     )
 
 
-def train_model(animal, version, features, edgelist, adj):
+def train_model(animal, version, features, edgelist, adj, encoder=None):
     (
         adj_norm,
         adj_label,
@@ -112,6 +113,10 @@ def train_model(animal, version, features, edgelist, adj):
         save_dir,
         n_epochs,
     )
+    if encoder is not None:
+        # Note: inference encodes node attributes with the encoder the weights were trained on
+        model_path = os.path.join(save_dir, "{}_{}_{}.pt".format(autoencoder.name, animal, version))
+        encoder.save(encoder_path(model_path))
 
 
 if __name__ == "__main__":
@@ -130,8 +135,9 @@ if __name__ == "__main__":
           lines = f.readlines()
     for path in lines:
         path = path.replace("\n", "")       
-        features, edgelist, adj, _, _ = ASNRGraph(path=path).preprocess()
+        asnr = ASNRGraph(path=path)
+        features, edgelist, adj, _, _ = asnr.preprocess()
         animal = path.split("/")[-2] #.split(".")[0]
-        train_model(animal, "default", features, edgelist, adj)
+        train_model(animal, "default", features, edgelist, adj, asnr.feature_encoder)
         print("Animal trained for: ", animal)
    
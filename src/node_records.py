@@ -0,0 +1,34 @@
+class NodeRecords:
+    """
+    One row per node: its attributes, then its centrality metrics, in the fixed column
+    order of `columns`. Missing attributes are None.
+
+    Built once per graph state (see Graph.node_records), a node is then looked up in O(1)
+    instead of going through the feature and metric dictionaries of the whole graph.
+    """
+
+    def __init__(self, nodes, metrics: dict):
+        """nodes: (name, data) pairs as Graph.nodes, metrics: {metric: {node: value}} as Graph.metrics"""
+        nodes = list(nodes)
+        self.feature_columns = list(dict.fromkeys(key for _, data in nodes for key in data))
+        self.metric_columns = list(metrics)
+        self.columns = self.feature_columns + self.metric_columns
+        self.index = {column: i for i, column in enumerate(self.columns)}
+        metric_values = list(metrics.values())
+        self.rows = {
+            name: tuple([data.get(column) for column in self.feature_columns] +
+                        [values.get(name) for values in metric_values])
+            for name, data in nodes
+        }
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, node):
+        return node in self.rows
+
+    def row(self, node) -> tuple:
+        return self.rows[node]
+
+    def value(self, node, column):
+        return self.rows[node][self.index[column]]
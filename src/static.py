@@ -1,23 +1,18 @@
 import os
-import glob
-import pickle
-from collections import defaultdict
 
 import sys
 
+from .storage.manifest import ManifestStore
+from .storage.catalog import DatasetCatalog, GraphDataView, VersionsView, parse_readme  # noqa: F401
 
-def parse_readme(path):
-    metadata = defaultdict(lambda: "n/a")
-    with open(path, "r") as file:
-        # Skip first 2 lines
-        for _ in range(2):
-            next(file)
-        for line in file:
-            data = line.split("|")
-            if len(data) == 2:
-                k, v = data
-                metadata[k.strip()] = v.strip()
-    return metadata
+
+def version_file(animal_folder, version):
+    """Saved version in animal_folder: columnar .npz, or .pkl written by older releases"""
+    for extension in VERSION_EXTENSIONS:
+        path = os.path.join(animal_folder, version + extension)
+        if os.path.isfile(path):
+            return path
+    return os.path.join(animal_folder, version + VERSION_EXTENSIONS[0])
 
 
 # ==================================================
@@ -32,33 +27,24 @@ MAIN_WINDOW_HEIGHT = 800
 MAIN_WINDOW_WIDTH = 1040
 
 GRAPH_VERSION_FOLDER = "./results/graphs/"
+VERSION_EXTENSIONS = (".npz", ".pkl")  # Columnar files, pickles of older releases
+VERSION_SNAPSHOT_INTERVAL = 10  # Every k-th saved version stores the full graph, others a delta
+CACHE_FOLDER = "./results/cache/"
+ANALYTICS_CACHE_MAX_BYTES = 256 * 1024**2
+EVOLUTION_CACHE_SIZE = 8  # Decoded versions kept in memory by the evolution page
+MULTILEVEL_LAYOUT_MIN_NODES = 1000  # Larger graphs are laid out by the multilevel engine
+HOVER_INTERVAL = 16  # ms, hover events are handled at most once per display frame
+
+DATASETS_FILE = "datasets/final_datasets.txt"
+
+# Dataset and version tables, read on first access and cached in CACHE_FOLDER/catalog.json
+CATALOG = DatasetCatalog(DATASETS_FILE, GRAPH_VERSION_FOLDER, VERSION_EXTENSIONS,
+                         os.path.join(CACHE_FOLDER, "catalog.json"))
+GRAPH_DATA = GraphDataView(CATALOG)
+VERSIONS = VersionsView(CATALOG)
 
-with open("datasets/final_datasets.txt") as f:
-    paths = [x.strip() for x in f.readlines()]
-
-GRAPH_DATA = defaultdict(dict)
-
-for path in paths:
-    category, name, _ = path.split("/")[3:]
-    metadata = parse_readme(glob.glob(os.path.join(*path.split("/")[:-1], "*.md"))[0])
-    GRAPH_DATA[category][name] = {
-        "path": path,
-        "title": "Placeholder " + name,
-        "metadata": metadata,
-    }
-
-GRAPH_DATA = dict(GRAPH_DATA)
-
-# Generated version table
-VERSIONS = {}
-for category in GRAPH_DATA.keys():
-    for animal in GRAPH_DATA[category].keys():
-        animal_folder = os.path.join(GRAPH_VERSION_FOLDER, animal)
-        VERSIONS[animal] = ["default"]
-        if os.path.isdir(animal_folder):
-            filenames = [x for x in os.listdir(animal_folder) if x.endswith(".pkl")]
-            filenames.sort()
-            VERSIONS[animal].extend([x[:-4] for x in filenames])  # removing .pkl
+# Lineage and headers of the saved versions, results/graphs/<animal>/manifest.json
+MANIFESTS = ManifestStore(GRAPH_VERSION_FOLDER, VERSION_EXTENSIONS)
 
 # ==================================================
 # Variables
@@ -93,12 +79,11 @@ class PageState:
     @staticmethod
     def select_version(version):
         PageState.version = version
-        PageState.version_path = os.path.join(GRAPH_VERSION_FOLDER, PageState.id, version + ".pkl")
-        if os.path.isfile(PageState.version_path):
-            with open(PageState.version_path, "rb") as f:
-                data = pickle.load(f)
-                PageState.prev_version = data['prev_version']
-                PageState.prev_path = data['prev_path']
+        PageState.version_path = version_file(os.path.join(GRAPH_VERSION_FOLDER, PageState.id), version)
+        entry = MANIFESTS[PageState.id].entry(version) if os.path.isfile(PageState.version_path) else None
+        if entry is not None:
+            PageState.prev_version = entry['prev_version']
+            PageState.prev_path = entry['prev_path']
         else:
             PageState.prev_version = None
             PageState.prev_path = None
@@ -108,6 +93,5 @@ class PageState:
         PageState.prev_version = PageState.version
         PageState.prev_path = PageState.version_path
         PageState.version = new_version
-        PageState.version_path = os.path.join(GRAPH_VERSION_FOLDER,
-                                              PageState.id,
-                                              new_version + ".pkl")
+        PageState.version_path = version_file(os.path.join(GRAPH_VERSION_FOLDER, PageState.id),
+                                              new_version)
@@ -0,0 +1,174 @@
+import os
+import json
+import pickle
+import hashlib
+import logging
+import tempfile
+import threading
+import networkx as nx
+
+from ..static import CACHE_FOLDER, ANALYTICS_CACHE_MAX_BYTES
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('analytics_cache')
+
+_MISSING = object()
+
+
+def graph_fingerprint(graph: nx.Graph) -> str:
+    """Content hash of a graph: nodes, edges and all of their attributes (weights included)"""
+
+    def canonical(obj):
+        return json.dumps(obj, sort_keys=True, default=str)
+
+    nodes = sorted(canonical([str(node), data]) for node, data in graph.nodes(data=True))
+    if graph.is_directed():
+        edges = sorted(canonical([str(u), str(v), data]) for u, v, data in graph.edges(data=True))
+    else:
+        edges = sorted(
+            canonical(sorted([str(u), str(v)]) + [data]) for u, v, data in graph.edges(data=True))
+
+    sha = hashlib.sha1()
+    sha.update(canonical([type(graph).__name__, graph.graph]).encode())
+    for record in nodes:
+        sha.update(record.encode())
+    sha.update(b"|edges|")
+    for record in edges:
+        sha.update(record.encode())
+    return sha.hexdigest()
+
+
+class AnalyticsCache:
+    """
+    Persistent cache of analytics results (node/graph metrics, partitions, layouts).
+
+    Entries live in <folder>/<fingerprint>/<name>.pkl, so an unchanged graph finds its
+    results again after a restart. The modification time of an entry is bumped on every
+    hit, and the least recently used entries are evicted once the folder exceeds max_bytes.
+
+    Note: sizes and modification times are indexed in memory (the folder is walked once),
+    so a put does not stat the whole cache. The cache is shared with the evolution workers,
+    get, put and evict hold a lock; values are computed outside of it, and a value being
+    computed by another thread is waited for instead of being computed twice.
+    """
+
+    def __init__(self, folder=os.path.join(CACHE_FOLDER, "analytics"),
+                 max_bytes=ANALYTICS_CACHE_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._entries = None  # path -> (mtime, size), see _index
+        self._total = 0
+        self._lock = threading.RLock()
+        self._pending = {}  # (fingerprint, name) -> Event set once computed, see get_or_compute
+
+    def _index(self):
+        """Size and modification time of every entry, read from disk on first use"""
+        if self._entries is None:
+            self._entries, self._total = {}, 0
+            for root, _, filenames in os.walk(self.folder):
+                for filename in filenames:
+                    if filename.endswith(".pkl"):
+                        self._track(os.path.join(root, filename))
+        return self._entries
+
+    def _track(self, path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        self._untrack(path)
+        self._entries[path] = (stat.st_mtime, stat.st_size)
+        self._total += stat.st_size
+
+    def _untrack(self, path):
+        _, size = self._entries.pop(path, (None, 0))
+        self._total -= size
+
+    def _path(self, fingerprint, name):
+        return os.path.join(self.folder, fingerprint, name + ".pkl")
+
+    def get(self, fingerprint, name, default=None):
+        with self._lock:
+            return self._get(fingerprint, name, default)
+
+    def _get(self, fingerprint, name, default):
+        path = self._path(fingerprint, name)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return default
+        try:
+            os.utime(path)  # Mark as recently used
+        except FileNotFoundError:
+            return value
+        self._index()
+        self._track(path)
+        return value
+
+    def put(self, fingerprint, name, value):
+        with self._lock:
+            self._put(fingerprint, name, value)
+
+    def _put(self, fingerprint, name, value):
+        path = self._path(fingerprint, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=name + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self._index()
+        self._track(path)
+        if self._total > self.max_bytes:
+            self.evict()
+
+    def get_or_compute(self, fingerprint, name, func):
+        """Return cached value of `name` for the graph, or compute it with func() and store it"""
+        key = (fingerprint, name)
+        while True:
+            with self._lock:
+                value = self._get(fingerprint, name, _MISSING)
+                if value is not _MISSING:
+                    logger.info(f"Loaded {name} of graph {fingerprint[:8]} from cache.")
+                    return value
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = threading.Event()
+                    break
+            pending.wait()
+
+        try:
+            value = func()
+            self.put(fingerprint, name, value)
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.set()
+        return value
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits into max_bytes"""
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        entries = self._index()
+        for path, (_, size) in sorted(entries.items(), key=lambda item: item[1]):
+            if self._total <= self.max_bytes:
+                break
+            self._untrack(path)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            try:
+                os.rmdir(os.path.dirname(path))  # Only succeeds once the graph has no entry left
+            except OSError:
+                pass
+            logger.info(f"Evicted {path} from analytics cache.")
+
+ANALYTICS_CACHE = AnalyticsCache()
@@ -0,0 +1,186 @@
+import os
+import glob
+import json
+import logging
+from collections import defaultdict
+from collections.abc import Mapping
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('catalog')
+
+
+def parse_readme(path):
+    metadata = defaultdict(lambda: "n/a")
+    with open(path, "r") as file:
+        # Skip first 2 lines
+        for _ in range(2):
+            next(file)
+        for line in file:
+            data = line.split("|")
+            if len(data) == 2:
+                k, v = data
+                metadata[k.strip()] = v.strip()
+    return metadata
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class DatasetCatalog:
+    """
+    Datasets listed in the datasets file and saved versions of every animal.
+
+    Nothing is read on import. The dataset table is built on first access and the versions
+    of an animal when they are first asked for. Both are cached on disk (JSON), keyed by the
+    modification times of the datasets file, the dataset folders and the version folders,
+    so a start with unchanged files only stats them, and a changed folder is the only one
+    read again. Versions created during the session are registered with add_version.
+    """
+
+    def __init__(self, datasets_file, version_folder, version_extensions, cache_path):
+        self.datasets_file = datasets_file
+        self.version_folder = version_folder
+        self.version_extensions = version_extensions
+        self.cache_path = cache_path
+        self._cache = None
+        self._graph_data = None
+        self._versions = {}  # animal -> {"mtime_ns", "versions"}, checked this session
+        self._added = defaultdict(list)  # animal -> versions created but maybe not saved yet
+
+    # =====================================================
+    # Disk cache
+    # =====================================================
+
+    def _disk(self) -> dict:
+        if self._cache is None:
+            try:
+                with open(self.cache_path) as f:
+                    self._cache = json.load(f)
+            except (OSError, ValueError):
+                self._cache = {}
+        return self._cache
+
+    def _flush(self):
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        with open(self.cache_path + ".tmp", "w") as f:
+            json.dump(self._disk(), f)
+        os.replace(self.cache_path + ".tmp", self.cache_path)
+
+    # =====================================================
+    # Datasets
+    # =====================================================
+
+    @property
+    def graph_data(self) -> dict:
+        """{category: {animal: {"path", "title", "metadata"}}}"""
+        if self._graph_data is None:
+            self._graph_data = self._read_graph_data()
+        return self._graph_data
+
+    def _read_graph_data(self):
+        cached = self._disk().get("datasets", {})
+        folders = cached.get("folders", {})
+        fresh = (cached.get("list_mtime_ns") == _mtime(self.datasets_file) and
+                 all(_mtime(folder) == mtime for folder, mtime in folders.items()))
+        if not fresh:
+            cached = self._scan_datasets(cached)
+            self._disk()["datasets"] = cached
+            self._flush()
+
+        graph_data = defaultdict(dict)
+        for entry in cached["entries"]:
+            graph_data[entry["category"]][entry["name"]] = {
+                "path": entry["path"],
+                "title": "Placeholder " + entry["name"],
+                "metadata": defaultdict(lambda: "n/a", entry["metadata"]),
+            }
+        return dict(graph_data)
+
+    def _scan_datasets(self, cached):
+        """Dataset entries, the README of unchanged folders is not parsed again"""
+        logger.info(f"Reading the datasets of {self.datasets_file}")
+        previous = {entry["folder"]: entry for entry in cached.get("entries", [])}
+        with open(self.datasets_file) as f:
+            paths = [x.strip() for x in f.readlines()]
+        entries, folders = [], {}
+        for path in paths:
+            category, name, _ = path.split("/")[3:]
+            folder = os.path.join(*path.split("/")[:-1])
+            folders[folder] = _mtime(folder)
+            entry = previous.get(folder)
+            if entry is None or cached["folders"].get(folder) != folders[folder] or entry["path"] != path:
+                readme = glob.glob(os.path.join(folder, "*.md"))[0]
+                entry = {"path": path, "folder": folder, "category": category, "name": name,
+                         "metadata": dict(parse_readme(readme))}
+            entries.append(entry)
+        return {"list_mtime_ns": _mtime(self.datasets_file), "folders": folders, "entries": entries}
+
+    # =====================================================
+    # Versions
+    # =====================================================
+
+    def versions(self, animal) -> list:
+        """Versions of animal: "default" then the saved ones, as sorted file names"""
+        folder = os.path.join(self.version_folder, animal)
+        mtime = _mtime(folder)
+        entry = self._versions.get(animal) or self._disk().get("versions", {}).get(animal)
+        if entry is None or entry["mtime_ns"] != mtime:
+            entry = {"mtime_ns": mtime, "versions": self._list_versions(folder)}
+            self._disk().setdefault("versions", {})[animal] = entry
+            self._flush()
+        self._versions[animal] = entry
+        saved = entry["versions"]
+        return ["default"] + saved + [version for version in self._added[animal] if version not in saved]
+
+    def _list_versions(self, folder):
+        if not os.path.isdir(folder):
+            return []
+        filenames = [x for x in os.listdir(folder) if x.endswith(self.version_extensions)]
+        filenames.sort()
+        return [x[:-4] for x in filenames]  # removing .npz / .pkl
+
+    def add_version(self, animal, version):
+        """Register a version created or saved in this session, listed before the folder is read again"""
+        if version != "default" and version not in self._added[animal]:
+            self._added[animal].append(version)
+
+
+class GraphDataView(Mapping):
+    """GRAPH_DATA of the catalog, built on first access"""
+
+    def __init__(self, catalog: DatasetCatalog):
+        self.catalog = catalog
+
+    def __getitem__(self, category):
+        return self.catalog.graph_data[category]
+
+    def __iter__(self):
+        return iter(self.catalog.graph_data)
+
+    def __len__(self):
+        return len(self.catalog.graph_data)
+
+
+class VersionsView(Mapping):
+    """{animal: versions} of the catalog, the versions of an animal are checked when accessed"""
+
+    def __init__(self, catalog: DatasetCatalog):
+        self.catalog = catalog
+
+    def _animals(self):
+        return [animal for animals in self.catalog.graph_data.values() for animal in animals]
+
+    def __getitem__(self, animal):
+        if animal not in self._animals():
+            raise KeyError(animal)
+        return self.catalog.versions(animal)
+
+    def __iter__(self):
+        return iter(self._animals())
+
+    def __len__(self):
+        return len(self._animals())
@@ -0,0 +1,351 @@
+from __future__ import annotations
+
+import numpy as np
+import networkx as nx
+import scipy.sparse as sp
+
+from .columnar import ColumnarGraph
+
+_DTYPES = {bool: np.bool_, int: np.int64, float: np.float64, str: np.str_}
+_CSR_INSERT_MAX = 256  # Larger batches of new edges sort the CSR again instead of inserting
+
+
+def _column(values, present):
+    """Typed numpy column of attribute values, object dtype if their types are mixed"""
+    types = {type(v) for v, p in zip(values, present) if p}
+    dtype = _DTYPES.get(types.pop(), object) if len(types) == 1 else object
+    if dtype is object:
+        column = np.empty(len(values), dtype=object)
+        for i, value in enumerate(values):
+            column[i] = value
+    else:
+        filler = "" if dtype is np.str_ else dtype(0)
+        column = np.array([v if p else filler for v, p in zip(values, present)], dtype=dtype)
+    return column, np.asarray(present, dtype=bool)
+
+
+def _append(column, value, present):
+    """Append one value to a column, widening its dtype if needed"""
+    return _extend(column, [value], [present])
+
+
+def _extend(column, values, present):
+    """Append rows to a column, the existing rows are only copied again if the dtype widens"""
+    old_values, old_mask = column
+    new_values, new_mask = _column(values, present)
+    if not new_mask.any():
+        # Note: absent rows keep the dtype of the column, with the filler of _column
+        new_values = np.empty(len(values), dtype=object) if old_values.dtype == object \
+            else np.zeros(len(values), dtype=old_values.dtype)
+    if new_values.dtype == old_values.dtype or new_values.dtype.kind == old_values.dtype.kind == "U":
+        return np.concatenate([old_values, new_values]), np.concatenate([old_mask, new_mask])
+    return _column(old_values.tolist() + list(values), old_mask.tolist() + list(present))
+
+
+def _assign(column, rows):
+    """Set the {row: value} of a column, widening its dtype if needed"""
+    values, mask = column
+    values, mask = values.tolist(), mask.tolist()
+    for i, value in rows.items():
+        values[i], mask[i] = value, True
+    return _column(values, mask)
+
+
+class CSRCore:
+    """
+    Compact storage of a simple undirected graph.
+
+    - node table: `names` (index -> name), `index` (name -> index) and one typed column
+      per node attribute
+    - edge table: `src` <= `dst` node indices and one typed column per edge attribute
+    - CSR adjacency over the edge table: `indptr`, `indices` and `edge_ids`, rebuilt with
+      numpy after edits, so neighbourhood queries are slices.
+
+    Every column is stored as (values, present): `present` marks which rows have the attribute.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.index = {}
+        self.node_columns = {}
+        self.src = np.zeros(0, dtype=np.int64)
+        self.dst = np.zeros(0, dtype=np.int64)
+        self.edge_columns = {}
+        self.graph_attrs = {}
+        self._csr = None
+
+    # =====================================================
+    # Conversion
+    # =====================================================
+
+    @classmethod
+    def from_columnar(cls, columns: ColumnarGraph) -> CSRCore:
+        """Core over the tables of a columnar file, arrays stay memory-mapped until edited"""
+        core = cls()
+        core.graph_attrs = dict(columns.meta["graph"])
+        core.names = columns.names
+        core.index = {name: i for i, name in enumerate(core.names)}
+        core.node_columns = columns.columns("node")
+        # Edges are written in node order from their first end, so src <= dst already
+        core.src, core.dst = columns.src, columns.dst
+        core.edge_columns = columns.columns("edge")
+        return core
+
+    @classmethod
+    def from_networkx(cls, graph: nx.Graph) -> CSRCore:
+        if graph.is_directed() or graph.is_multigraph():
+            raise ValueError("CSRCore only stores simple undirected graphs")
+        core = cls()
+        core.graph_attrs = dict(graph.graph)
+        core.names = list(graph.nodes)
+        core.index = {name: i for i, name in enumerate(core.names)}
+        core.node_columns = cls._columns([data for _, data in graph.nodes(data=True)])
+
+        edges = list(graph.edges(data=True))
+        pairs = np.array([(core.index[u], core.index[v]) for u, v, _ in edges],
+                         dtype=np.int64).reshape(-1, 2)
+        core.src, core.dst = pairs.min(axis=1), pairs.max(axis=1)
+        core.edge_columns = cls._columns([data for _, _, data in edges])
+        return core
+
+    @staticmethod
+    def _columns(records):
+        keys = list(dict.fromkeys(key for record in records for key in record))
+        return {
+            key: _column([record.get(key) for record in records], [key in record for record in records])
+            for key in keys
+        }
+
+    def to_networkx(self) -> nx.Graph:
+        graph = nx.Graph(**self.graph_attrs)
+        graph.add_nodes_from(zip(self.names, self._records(self.node_columns, len(self.names))))
+        graph.add_edges_from(
+            (self.names[u], self.names[v], data)
+            for u, v, data in zip(self.src.tolist(), self.dst.tolist(),
+                                  self._records(self.edge_columns, len(self.src))))
+        return graph
+
+    @staticmethod
+    def _records(columns, n):
+        records = [{} for _ in range(n)]
+        for key, (values, present) in columns.items():
+            for i, value in zip(np.flatnonzero(present).tolist(), values[present].tolist()):
+                records[i][key] = value
+        return records
+
+    @staticmethod
+    def _row(columns, i) -> dict:
+        return {
+            key: values[i].item() if isinstance(values[i], np.generic) else values[i]
+            for key, (values, present) in columns.items()
+            if present[i]
+        }
+
+    def node_data(self, i) -> dict:
+        return self._row(self.node_columns, i)
+
+    def edge_data(self, e) -> dict:
+        return self._row(self.edge_columns, e)
+
+    # =====================================================
+    # Adjacency
+    # =====================================================
+
+    @property
+    def n_nodes(self):
+        return len(self.names)
+
+    @property
+    def n_edges(self):
+        return len(self.src)
+
+    @property
+    def csr(self):
+        """(indptr, indices, edge_ids), each edge appears in the rows of both its ends"""
+        if self._csr is None:
+            loops = self.src == self.dst
+            rows = np.concatenate([self.src, self.dst[~loops]])
+            cols = np.concatenate([self.dst, self.src[~loops]])
+            edge_ids = np.concatenate([np.arange(self.n_edges), np.flatnonzero(~loops)])
+            order = np.lexsort((cols, rows))
+            indptr = np.zeros(self.n_nodes + 1, dtype=np.int64)
+            np.cumsum(np.bincount(rows, minlength=self.n_nodes), out=indptr[1:])
+            self._csr = indptr, cols[order], edge_ids[order]
+        return self._csr
+
+    @property
+    def indptr(self):
+        return self.csr[0]
+
+    @property
+    def indices(self):
+        return self.csr[1]
+
+    @property
+    def weights(self):
+        """Edge weight of every CSR entry, 1 where the edge has no weight"""
+        edge_ids = self.csr[2]
+        if "weight" not in self.edge_columns:
+            return np.ones(len(edge_ids))
+        values, present = self.edge_columns["weight"]
+        return np.where(present, values, 1).astype(np.float64)[edge_ids]
+
+    def degrees(self) -> np.ndarray:
+        # Self-loops count twice, as in networkx
+        loops = np.bincount(self.src[self.src == self.dst], minlength=self.n_nodes)
+        return np.diff(self.indptr) + loops
+
+    def neighbors(self, i) -> np.ndarray:
+        indptr, indices, _ = self.csr
+        return indices[indptr[i]:indptr[i + 1]]
+
+    def edge_id(self, i, j):
+        indptr, indices, edge_ids = self.csr
+        row = indices[indptr[i]:indptr[i + 1]]
+        pos = np.searchsorted(row, j)
+        return int(edge_ids[indptr[i] + pos]) if pos < len(row) and row[pos] == j else None
+
+    def adjacency(self, weight=True) -> sp.csr_matrix:
+        indptr, indices, _ = self.csr
+        data = self.weights if weight else np.ones(len(indices))
+        return sp.csr_matrix((data, indices, indptr), shape=(self.n_nodes, self.n_nodes))
+
+    def ego(self, i, k=1) -> np.ndarray:
+        """Indices of the nodes at most k hops away from node i, i included"""
+        indptr, indices, _ = self.csr
+        visited = {i}
+        frontier = np.array([i], dtype=np.int64)
+        for _ in range(k):
+            reached = np.unique(np.concatenate([indices[indptr[j]:indptr[j + 1]] for j in frontier]))
+            frontier = np.array([j for j in reached.tolist() if j not in visited], dtype=np.int64)
+            visited.update(frontier.tolist())
+            if not len(frontier):
+                break
+        return np.sort(np.fromiter(visited, dtype=np.int64))
+
+    def subgraph(self, nodes) -> nx.Graph:
+        """Induced networkx subgraph on the node indices `nodes`, built from their rows only"""
+        indptr, indices, edge_ids = self.csr
+        nodes = np.asarray(nodes, dtype=np.int64)
+        rows = [np.arange(indptr[i], indptr[i + 1]) for i in nodes.tolist()]
+        entries = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+        inside = np.isin(indices[entries], nodes)
+        edges = np.unique(edge_ids[entries[inside]])
+
+        graph = nx.Graph(**self.graph_attrs)
+        graph.add_nodes_from((self.names[i], self.node_data(i)) for i in nodes.tolist())
+        graph.add_edges_from(
+            (self.names[u], self.names[v], self.edge_data(e))
+            for e, u, v in zip(edges.tolist(), self.src[edges].tolist(), self.dst[edges].tolist()))
+        return graph
+
+    def triangles(self) -> np.ndarray:
+        adj = self.adjacency(weight=False)
+        adj.setdiag(0)
+        adj.eliminate_zeros()
+        return np.asarray((adj @ adj).multiply(adj).sum(axis=1)).ravel() // 2
+
+    # =====================================================
+    # Edits
+    # =====================================================
+
+    def add_node(self, name, data):
+        if name in self.index:
+            i = self.index[name]
+            for key, value in data.items():
+                column = self._widen(self.node_columns, key, self.n_nodes)
+                self.node_columns[key] = _assign(column, {i: value})
+            return
+        self.index[name] = len(self.names)
+        self.names.append(name)
+        for key in set(self.node_columns) | set(data):
+            column = self._widen(self.node_columns, key, self.n_nodes - 1)
+            self.node_columns[key] = _append(column, data.get(key), key in data)
+        self._csr = None
+
+    def add_edge(self, u, v, data):
+        self.add_edges([(u, v, data)])
+
+    def add_edges(self, edges):
+        """
+        Add (u, v, data) edges between existing nodes, or update the data of those already
+        in the table. New edges are appended with one concatenate per array, and the CSR
+        is rebuilt once, on next use.
+        """
+        new = {}  # (i, j) -> data of the edges not in the table yet
+        updates = {}  # edge id -> data
+        for u, v, data in edges:
+            i, j = sorted((self.index[u], self.index[v]))
+            if (i, j) in new:
+                new[(i, j)].update(data)
+                continue
+            e = self.edge_id(i, j)
+            if e is None:
+                new[(i, j)] = dict(data)
+            else:
+                updates.setdefault(e, {}).update(data)
+
+        for key in {key for data in updates.values() for key in data}:
+            column = self._widen(self.edge_columns, key, self.n_edges)
+            self.edge_columns[key] = _assign(column, {e: data[key] for e, data in updates.items() if key in data})
+
+        if not new:
+            return
+        n = self.n_edges
+        pairs = np.array(list(new), dtype=np.int64).reshape(-1, 2)
+        self.src, self.dst = np.concatenate([self.src, pairs[:, 0]]), np.concatenate([self.dst, pairs[:, 1]])
+        records = list(new.values())
+        for key in set(self.edge_columns) | {key for data in records for key in data}:
+            column = self._widen(self.edge_columns, key, n)
+            self.edge_columns[key] = _extend(column, [data.get(key) for data in records],
+                                             [key in data for data in records])
+        if self._csr is not None and len(pairs) <= _CSR_INSERT_MAX:
+            self._insert_csr(pairs, n)
+        else:
+            self._csr = None
+
+    def _insert_csr(self, pairs, first_id):
+        """Insert a few new edges, with ids from first_id, into the CSR instead of sorting it again"""
+        indptr, indices, edge_ids = self._csr
+        ids = np.arange(first_id, first_id + len(pairs))
+        loops = pairs[:, 0] == pairs[:, 1]
+        rows = np.concatenate([pairs[:, 0], pairs[~loops, 1]])
+        cols = np.concatenate([pairs[:, 1], pairs[~loops, 0]])
+        ids = np.concatenate([ids, ids[~loops]])
+        order = np.lexsort((cols, rows))
+        rows, cols, ids = rows[order], cols[order], ids[order]
+        positions = [indptr[i] + np.searchsorted(indices[indptr[i]:indptr[i + 1]], j)
+                     for i, j in zip(rows.tolist(), cols.tolist())]
+        indptr = indptr.copy()
+        indptr[1:] += np.cumsum(np.bincount(rows, minlength=self.n_nodes))
+        self._csr = indptr, np.insert(indices, positions, cols), np.insert(edge_ids, positions, ids)
+
+    def remove_edge(self, u, v):
+        i, j = sorted((self.index[u], self.index[v]))
+        e = self.edge_id(i, j)
+        if e is not None:
+            self._drop_edges(np.array([e]))
+
+    def remove_node(self, name):
+        i = self.index.pop(name)
+        self._drop_edges(np.flatnonzero((self.src == i) | (self.dst == i)))
+        del self.names[i]
+        self.index = {name: k for k, name in enumerate(self.names)}
+        self.src = self.src - (self.src > i)
+        self.dst = self.dst - (self.dst > i)
+        for key, (values, present) in self.node_columns.items():
+            self.node_columns[key] = np.delete(values, i), np.delete(present, i)
+        self._csr = None
+
+    def _drop_edges(self, edge_ids):
+        self.src, self.dst = np.delete(self.src, edge_ids), np.delete(self.dst, edge_ids)
+        for key, (values, present) in self.edge_columns.items():
+            self.edge_columns[key] = np.delete(values, edge_ids), np.delete(present, edge_ids)
+        self._csr = None
+
+    @staticmethod
+    def _widen(columns, key, n):
+        """Column of attribute `key`, created empty (absent everywhere) if it is new"""
+        if key not in columns:
+            return _column([None] * n, [False] * n)
+        return columns[key]
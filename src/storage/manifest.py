@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import pickle
+import logging
+
+from .columnar import ColumnarFile
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('manifest')
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+
+
+def _stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class VersionManifest:
+    """
+    Index of the saved versions of one animal, <animal folder>/manifest.json:
+    {version: {file, mtime_ns, size, kind, depth, base, prev_version, prev_path, saved_at, n_nodes, n_edges}}
+
+    Lineage and header lookups are answered from the index instead of opening version files.
+    The store records every version it writes. Entries are checked against the size and
+    modification time of their file whenever the folder changed behind the back of the
+    manifest, and files without an entry (older releases, copied in by hand) are indexed
+    from their header the first time they are asked for.
+    Versions created by Retrain are recorded before their file exists, with file None.
+    """
+
+    def __init__(self, folder, extensions):
+        self.folder = folder
+        self.extensions = extensions
+        self.path = os.path.join(folder, MANIFEST_NAME)
+        self._entries = None
+        self._folder_mtime = None  # mtime_ns of the folder when the entries were last checked
+
+    def _file(self, version):
+        for extension in self.extensions:
+            filename = str(version) + extension
+            if os.path.isfile(os.path.join(self.folder, filename)):
+                return filename
+        return None
+
+    # =====================================================
+    # Disk
+    # =====================================================
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path) as f:
+                    spec = json.load(f)
+                self._entries = spec["versions"] if spec.get("format") == FORMAT_VERSION else {}
+            except (OSError, ValueError, KeyError):
+                self._entries = {}
+        folder_mtime = os.stat(self.folder).st_mtime_ns if os.path.isdir(self.folder) else None
+        if folder_mtime != self._folder_mtime:
+            self._check()
+        return self._entries
+
+    def _check(self):
+        """Drop the entries whose file changed or disappeared, they are indexed again on use"""
+        stale = [version for version, entry in self._entries.items() if entry["file"] is not None and
+                 _stat(os.path.join(self.folder, entry["file"])) != (entry["mtime_ns"], entry["size"])]
+        for version in stale:
+            del self._entries[version]
+        if stale:
+            self._flush()
+        else:
+            self._folder_mtime = os.stat(self.folder).st_mtime_ns if os.path.isdir(self.folder) else None
+
+    def _flush(self):
+        if not os.path.isdir(self.folder):
+            self._folder_mtime = None
+            return
+        with open(self.path + ".tmp", "w") as f:
+            json.dump({"format": FORMAT_VERSION, "versions": self._entries}, f)
+        os.replace(self.path + ".tmp", self.path)
+        # Note: replacing the manifest changes the folder mtime, remember the new one
+        self._folder_mtime = os.stat(self.folder).st_mtime_ns
+
+    # =====================================================
+    # Recording
+    # =====================================================
+
+    def record(self, version, meta, graph=None, filepath=None):
+        """Entry of a version written to filepath (None if not saved yet) with its meta data"""
+        entries = self._load()
+        entry = {
+            "file": None, "mtime_ns": None, "size": None,
+            "kind": meta.get("kind", "snapshot"),
+            "depth": meta.get("depth", 0),
+            "base": meta.get("base"),
+            "prev_version": meta["prev_version"],
+            "prev_path": meta["prev_path"],
+            "saved_at": time.time(),
+            "n_nodes": None if graph is None else graph.number_of_nodes(),
+            "n_edges": None if graph is None else graph.number_of_edges(),
+        }
+        if filepath is not None:
+            entry["file"] = os.path.basename(filepath)
+            entry["mtime_ns"], entry["size"] = _stat(filepath)
+        entries[str(version)] = entry
+        self._flush()
+
+    def _index(self, version, filename):
+        """Entry of a file saved without the manifest, read from its header"""
+        filepath = os.path.join(self.folder, filename)
+        mtime_ns, size = _stat(filepath)
+        entry = {"file": filename, "mtime_ns": mtime_ns, "size": size, "saved_at": mtime_ns / 1e9,
+                 "n_nodes": None, "n_edges": None}
+        if filename.endswith(".pkl"):
+            with open(filepath, "rb") as f:
+                data = pickle.load(f)
+            graph = data["graph"]
+            entry.update(kind="snapshot", depth=0, base=None, n_nodes=graph.number_of_nodes(),
+                         n_edges=graph.number_of_edges())
+        else:
+            columns = ColumnarFile(filepath)
+            data = columns.meta
+            entry.update(kind=data.get("kind", "snapshot"), depth=data.get("depth", 0), base=data.get("base"))
+            if "names" in columns:
+                # Note: only the headers of the memory-mapped members are read
+                entry.update(n_nodes=len(columns["names"]), n_edges=len(columns["src"]))
+        entry.update(prev_version=data["prev_version"], prev_path=data["prev_path"])
+        logger.info(f"Indexed version {version} of {self.folder}")
+        return entry
+
+    # =====================================================
+    # Lookups
+    # =====================================================
+
+    def entry(self, version):
+        """Entry of version, None if it was never saved or recorded"""
+        entries = self._load()
+        version = str(version)
+        if version not in entries or entries[version]["file"] is None:
+            filename = self._file(version)
+            if filename is None:
+                return entries.get(version)
+            entries[version] = self._index(version, filename)
+            self._flush()
+        return entries[version]
+
+    def dependents(self, version) -> list:
+        """Versions stored as a delta against version, they need its file to be loaded"""
+        filenames = os.listdir(self.folder) if os.path.isdir(self.folder) else []
+        versions = {os.path.splitext(filename)[0] for filename in filenames
+                    if os.path.splitext(filename)[1] in self.extensions}
+        dependents = []
+        for other in sorted(versions):
+            entry = self.entry(other)
+            if entry is None or entry["kind"] != "delta":
+                continue
+            # Note: entries recorded before 'base' was indexed are deltas against prev_version
+            if entry.get("base", entry["prev_version"]) == str(version):
+                dependents.append(other)
+        return dependents
+
+    def lineage(self, version) -> list:
+        """Versions from 'default' to version, following prev_version"""
+        versions = [version]
+        while versions[-1] != "default":
+            entry = self.entry(versions[-1])
+            if entry is None or entry["prev_version"] is None or entry["prev_version"] in versions:
+                break
+            versions.append(entry["prev_version"])
+        versions.reverse()
+        return versions
+
+
+class ManifestStore:
+    """Manifests of the animal folders of the version folder, read once per session"""
+
+    def __init__(self, folder, extensions):
+        self.folder = folder
+        self.extensions = extensions
+        self._manifests = {}
+
+    def get(self, animal_folder) -> VersionManifest:
+        key = os.path.abspath(animal_folder)
+        if key not in self._manifests:
+            self._manifests[key] = VersionManifest(animal_folder, self.extensions)
+        return self._manifests[key]
+
+    def __getitem__(self, animal) -> VersionManifest:
+        return self.get(os.path.join(self.folder, str(animal)))
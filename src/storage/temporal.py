@@ -0,0 +1,287 @@
+from __future__ import annotations
+
+import os
+import re
+import json
+import hashlib
+import logging
+import numpy as np
+import networkx as nx
+
+from .columnar import ColumnarFile, _write, decode_column, encode_column, read_meta
+from ..static import CACHE_FOLDER
+from src.loaders.asnr_dataloader import read_asnr_graphml
+from src.loaders.graphml_cache import GRAPHML_CACHE
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('temporal')
+
+FORMAT_VERSION = 1
+
+# Name of a slice: everything up to its last number, the period, and what follows it
+_SLICE_NAME = re.compile(r"^(.*?)(\d+)(\D*)$")
+
+
+def study_periods(path) -> list:
+    """
+    [(period, path)] of every slice of the study a GraphML file belongs to, sorted by period.
+    Slices are the files of the same folder whose names only differ by their last number,
+    e.g. ant_mersch_col1_day01_attribute.graphml, ant_mersch_col1_day02_attribute.graphml.
+    """
+    folder, filename = os.path.split(path)
+    stem, extension = os.path.splitext(filename)
+    match = _SLICE_NAME.match(stem)
+    if match is None:
+        return [(0, path)]
+    prefix, _, suffix = match.groups()
+    sibling = re.compile(re.escape(prefix) + r"(\d+)" + re.escape(suffix + extension) + "$")
+    periods = []
+    for name in os.listdir(folder or "."):
+        sibling_match = sibling.match(name)
+        if sibling_match:
+            periods.append((int(sibling_match.group(1)), os.path.join(folder, name)))
+    return sorted(periods)
+
+
+# =====================================================
+# Building
+# =====================================================
+
+def _encode_table(arrays, columns, table, records):
+    for i, key in enumerate(dict.fromkeys(key for record in records for key in record)):
+        present = [key in record for record in records]
+        arrays[f"{table}/{i}"], kind = encode_column([record.get(key) for record in records], present)
+        arrays[f"{table}_mask/{i}"] = np.array(present, dtype=bool)
+        columns[table][key] = {"member": i, "kind": kind}
+
+
+def save_temporal(file, slices, meta=None):
+    """
+    Write the slices [(period, graph)] of a study into a container: one node table shared
+    by all periods, node appearances and edges as arrays sorted by period, and the offsets
+    of every period in both.
+    """
+    names, index = [], {}
+    node_time, node_index, node_records = [], [], []
+    edge_time, edge_pairs, edge_records = [], [], []
+    node_ptr, edge_ptr, graphs = [0], [0], []
+    for k, (_, graph) in enumerate(slices):
+        if graph.is_directed() or graph.is_multigraph():
+            raise ValueError("Temporal stores only hold simple undirected graphs")
+        for node, data in graph.nodes(data=True):
+            if node not in index:
+                index[node] = len(names)
+                names.append(node)
+            node_index.append(index[node])
+            node_records.append(data)
+        # Note: walks the adjacency dicts directly, edges listed once from their first end
+        seen = set()
+        for u, neighbors in graph._adj.items():
+            for v, data in neighbors.items():
+                if v not in seen:
+                    edge_pairs.append((index[u], index[v]))
+                    edge_records.append(data)
+            seen.add(u)
+        node_time.extend([k] * (len(node_index) - node_ptr[-1]))
+        edge_time.extend([k] * (len(edge_pairs) - edge_ptr[-1]))
+        node_ptr.append(len(node_index))
+        edge_ptr.append(len(edge_pairs))
+        graphs.append(graph.graph)
+
+    pairs = np.array(edge_pairs, dtype=np.int64).reshape(-1, 2)
+    arrays = {
+        "node_time": np.array(node_time, dtype=np.int64),
+        "node_index": np.array(node_index, dtype=np.int64),
+        "node_ptr": np.array(node_ptr, dtype=np.int64),
+        "time": np.array(edge_time, dtype=np.int64),
+        "src": pairs.min(axis=1),
+        "dst": pairs.max(axis=1),
+        "edge_ptr": np.array(edge_ptr, dtype=np.int64),
+    }
+    arrays["names"], names_kind = encode_column(names, [True] * len(names))
+    columns = {"node": {}, "edge": {}}
+    _encode_table(arrays, columns, "node", node_records)
+    _encode_table(arrays, columns, "edge", edge_records)
+    meta = dict(meta or {}, format=FORMAT_VERSION, periods=[period for period, _ in slices],
+                names_kind=names_kind, columns=columns, graphs=graphs)
+    _write(file, arrays, meta)
+
+
+# =====================================================
+# Queries
+# =====================================================
+
+class TemporalGraph:
+    """
+    All periods of a study: a node table shared by the periods, node appearances and
+    time-stamped edges (src <= dst, indices into the node table), sorted by period.
+
+    `node_ptr` / `edge_ptr` hold the offset of every period, so the rows of a range of
+    periods are one slice of the arrays: snapshots and sliding-window aggregates only read
+    (and, memory-mapped, only load) the rows of their periods.
+    """
+
+    def __init__(self, path, mmap=True):
+        self.file = ColumnarFile(path, mmap=mmap)
+        self.meta = self.file.meta
+        self.periods = self.meta["periods"]
+        self.names = decode_column(self.file["names"], self.meta["names_kind"]).tolist()
+        self.node_ptr = np.asarray(self.file["node_ptr"])
+        self.edge_ptr = np.asarray(self.file["edge_ptr"])
+
+    @property
+    def n_nodes(self):
+        return len(self.names)
+
+    def period_index(self, period) -> int:
+        return self.periods.index(period)
+
+    def _range(self, start, stop):
+        """Indices [first, last + 1) of the periods start..stop (both included)"""
+        first, last = self.period_index(start), self.period_index(stop)
+        if last < first:
+            raise ValueError(f"Empty range of periods {start}..{stop}")
+        return first, last + 1
+
+    @staticmethod
+    def _count(rows):
+        return rows.stop - rows.start if isinstance(rows, slice) else len(rows)
+
+    def _records(self, table, rows) -> list:
+        """Attribute dicts of rows (a slice or index array) of the 'node' or 'edge' table"""
+        records = [{} for _ in range(self._count(rows))]
+        for key, info in self.meta["columns"][table].items():
+            present = np.asarray(self.file[f"{table}_mask/{info['member']}"][rows])
+            values = self.file[f"{table}/{info['member']}"][rows][present]
+            for i, value in zip(np.flatnonzero(present).tolist(),
+                                decode_column(values, info["kind"]).tolist()):
+                records[i][key] = value
+        return records
+
+    def _weights(self, rows) -> np.ndarray:
+        info = self.meta["columns"]["edge"].get("weight")
+        if info is None or info["kind"] not in ("int", "float", "bool"):
+            return np.ones(self._count(rows))
+        weights = np.asarray(self.file[f"edge/{info['member']}"][rows], dtype=np.float64)
+        return np.where(self.file[f"edge_mask/{info['member']}"][rows], weights, 1.0)
+
+    def snapshot(self, period) -> nx.Graph:
+        """Graph of one period, as it was read from its GraphML file"""
+        k = self.period_index(period)
+        graph = nx.Graph(**self.meta["graphs"][k])
+        nodes = slice(self.node_ptr[k], self.node_ptr[k + 1])
+        names = [self.names[i] for i in np.asarray(self.file["node_index"][nodes]).tolist()]
+        graph.add_nodes_from(zip(names, self._records("node", nodes)))
+        edges = slice(self.edge_ptr[k], self.edge_ptr[k + 1])
+        src, dst = np.asarray(self.file["src"][edges]).tolist(), np.asarray(self.file["dst"][edges]).tolist()
+        adj = graph._adj
+        for u, v, data in zip(src, dst, self._records("edge", edges)):
+            u, v = self.names[u], self.names[v]
+            adj[u][v] = data
+            adj[v][u] = data
+        return graph
+
+    def window(self, start, stop, how="sum") -> nx.Graph:
+        """
+        Aggregate of the periods start..stop (both included): every node and edge seen in the
+        window, with the attributes of their last appearance. Edge weights are combined with
+        `how`, one of "sum", "mean", "max" or "count" (number of periods with the edge).
+        """
+        first, last = self._range(start, stop)
+        nodes = slice(self.node_ptr[first], self.node_ptr[last])
+        node_index = np.asarray(self.file["node_index"][nodes])
+        # Nodes in order of first appearance, attributes of the last one
+        _, first_rows = np.unique(node_index, return_index=True)
+        _, last_rows = np.unique(node_index[::-1], return_index=True)
+        last_rows = len(node_index) - 1 - last_rows
+        order = np.argsort(first_rows, kind="stable")
+        rows = nodes.start + last_rows[order]
+        graph = nx.Graph(**self.meta["graphs"][last - 1])
+        graph.add_nodes_from(zip([self.names[i] for i in node_index[first_rows[order]].tolist()],
+                                 self._records("node", rows)))
+
+        edges = slice(self.edge_ptr[first], self.edge_ptr[last])
+        keys = np.asarray(self.file["src"][edges]) * self.n_nodes + np.asarray(self.file["dst"][edges])
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        weights = self._weights(edges)
+        count = np.bincount(inverse, minlength=len(unique_keys))
+        if how == "sum":
+            combined = np.bincount(inverse, weights, minlength=len(unique_keys))
+        elif how == "mean":
+            combined = np.bincount(inverse, weights, minlength=len(unique_keys)) / count
+        elif how == "max":
+            combined = np.full(len(unique_keys), -np.inf)
+            np.maximum.at(combined, inverse, weights)
+        elif how == "count":
+            combined = count.astype(np.float64)
+        else:
+            raise ValueError(f"Unknown aggregation {how}")
+        last_edge = np.zeros(len(unique_keys), dtype=np.int64)
+        np.maximum.at(last_edge, inverse, np.arange(len(keys)))
+        adj = graph._adj
+        for key, data, weight in zip(unique_keys.tolist(), self._records("edge", edges.start + last_edge),
+                                     combined.tolist()):
+            u, v = divmod(key, self.n_nodes)
+            u, v = self.names[u], self.names[v]
+            data["weight"] = weight
+            adj[u][v] = data
+            adj[v][u] = data
+        return graph
+
+    # =====================================================
+    # Time series
+    # =====================================================
+
+    def presence(self) -> np.ndarray:
+        """(periods x nodes) bool, True where the node appears in the period"""
+        present = np.zeros((len(self.periods), self.n_nodes), dtype=bool)
+        present[np.asarray(self.file["node_time"]), np.asarray(self.file["node_index"])] = True
+        return present
+
+    def degree_series(self, weighted=False) -> np.ndarray:
+        """(periods x nodes) degree of every node in every period, a self-loop counts twice"""
+        time = np.asarray(self.file["time"]) * self.n_nodes
+        weights = self._weights(slice(0, len(time))) if weighted else None
+        size = len(self.periods) * self.n_nodes
+        degrees = (np.bincount(time + self.file["src"], weights, minlength=size) +
+                   np.bincount(time + self.file["dst"], weights, minlength=size))
+        return degrees.reshape(len(self.periods), self.n_nodes)
+
+
+class TemporalStore:
+    """
+    Temporal graphs of studies, built once from the GraphML slices of the study and kept in
+    <folder>/<hash of the slice paths>.npz until one of the slices changes.
+    """
+
+    def __init__(self, folder=os.path.join(CACHE_FOLDER, "temporal")):
+        self.folder = folder
+        self._memo = {}
+
+    def load(self, path) -> TemporalGraph:
+        """Temporal graph of the study of the GraphML file at path"""
+        sources = []
+        for period, slice_path in study_periods(path):
+            stat = os.stat(slice_path)
+            sources.append({"period": period, "path": os.path.abspath(slice_path),
+                            "mtime_ns": stat.st_mtime_ns, "size": stat.st_size})
+        key = hashlib.sha1(json.dumps([source["path"] for source in sources]).encode()).hexdigest()
+        cache_path = os.path.join(self.folder, key + ".npz")
+        if key in self._memo and self._memo[key].meta["sources"] == sources:
+            return self._memo[key]
+        if not os.path.isfile(cache_path) or read_meta(cache_path).get("sources") != sources:
+            self._build(cache_path, sources)
+        self._memo[key] = TemporalGraph(cache_path)
+        return self._memo[key]
+
+    def _build(self, cache_path, sources):
+        logger.info(f"Building temporal graph of {len(sources)} periods.")
+        slices = [(source["period"], GRAPHML_CACHE.load(source["path"], read=read_asnr_graphml))
+                  for source in sources]
+        os.makedirs(self.folder, exist_ok=True)
+        with open(cache_path + ".tmp", "wb") as f:
+            save_temporal(f, slices, meta={"sources": sources})
+        os.replace(cache_path + ".tmp", cache_path)
+
+
+TEMPORAL_STORE = TemporalStore()
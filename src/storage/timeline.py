@@ -0,0 +1,85 @@
+import os
+import pickle
+import logging
+import threading
+
+import networkx as nx
+
+from ..diff import graph_delta
+from ..metrics import MetricEngine
+from ..static import CACHE_FOLDER
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('timeline')
+
+
+def source_key(path):
+    """(path, mtime_ns, size) of the file a version is read from, None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+
+def timeline_point(graph: nx.Graph, prev_graph: nx.Graph = None) -> dict:
+    """Metrics shown on the evolution plots, and the difference to the previous version"""
+    engine = MetricEngine(graph)
+    degrees = engine.degrees
+    point = {
+        "avg_degree": sum(degrees.values()) / len(degrees),
+        "avg_coeff": round(engine.avg_clustering, 6),
+        "n_nodes": len(graph),
+        "difference": ([], []),
+    }
+    if prev_graph is not None:
+        # Same as Graph.difference_to: new nodes, added and reweighted edges
+        delta = graph_delta(prev_graph, graph)
+        point["difference"] = (list(delta.added_nodes), list(delta.added_edges) + list(delta.changed_edges))
+    return point
+
+
+class TimelineCache:
+    """
+    Evolution timeline of every animal: the timeline_point of each version of a lineage, in
+    <folder>/<animal>.pkl. A point is keyed by the source_key of its version and of the
+    previous one, so it stays valid until one of both files is saved again.
+    """
+
+    def __init__(self, folder=os.path.join(CACHE_FOLDER, "timeline")):
+        self.folder = folder
+        self._points = {}  # animal -> {version: point}
+        self._lock = threading.Lock()
+
+    def _path(self, animal):
+        return os.path.join(self.folder, str(animal) + ".pkl")
+
+    def _load(self, animal):
+        if animal not in self._points:
+            try:
+                with open(self._path(animal), "rb") as f:
+                    self._points[animal] = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                self._points[animal] = {}
+        return self._points[animal]
+
+    def get(self, animal, version, sources):
+        """Cached point of version, sources = (source_key of version, of its previous version)"""
+        with self._lock:
+            point = self._load(animal).get(version)
+        if point is None or point["sources"] != sources or sources[0] is None:
+            return None
+        return point
+
+    def put(self, animal, version, sources, point):
+        with self._lock:
+            points = self._load(animal)
+            points[version] = dict(point, sources=sources)
+            os.makedirs(self.folder, exist_ok=True)
+            tmp_path = self._path(animal) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(points, f)
+            os.replace(tmp_path, self._path(animal))
+
+
+TIMELINE_CACHE = TimelineCache()
@@ -0,0 +1,221 @@
+import os
+import re
+import json
+import pickle
+import logging
+import threading
+import numpy as np
+
+from .columnar import ColumnarGraph, save_columnar
+from ..diff import GraphDelta, graph_delta
+from ..static import GRAPH_VERSION_FOLDER, VERSION_EXTENSIONS, VERSION_SNAPSHOT_INTERVAL, MANIFESTS, version_file
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('versions')
+
+_VERSION_FILE = re.compile(r"^v(\d+)\.(npz|pkl)$")
+
+
+class VersionStore:
+    """
+    Saved versions of the graphs, results/graphs/<animal>/vN.npz.
+
+    A version file is either a full snapshot (columnar graph and layout, see columnar.py)
+    or a delta against its prev_version: a GraphDelta plus the layout positions that
+    changed, kept in the JSON meta data of the file. Every `snapshot_interval`-th version
+    of a chain, and every version based on the default graph, is a snapshot, so loading
+    replays at most that many deltas. The meta data of every file has 'prev_version' and
+    'prev_path'. Pickled versions (vN.pkl) written by older releases can still be loaded,
+    saving such a version writes vN.npz and removes the pickle.
+    Every saved version is recorded in the manifest of its folder (see manifest.py).
+
+    Saving over an existing version first rewrites the deltas based on it as snapshots, so
+    they keep their content and their files (the keys of the caches built on them) change.
+    """
+
+    def __init__(self, folder=GRAPH_VERSION_FOLDER, snapshot_interval=VERSION_SNAPSHOT_INTERVAL):
+        self.folder = folder
+        self.snapshot_interval = snapshot_interval
+        self._last = None  # (path, stat, depth, state_dict) of the last loaded or saved version
+        self._lock = threading.RLock()  # versions are also loaded by the evolution workers
+
+    def path(self, animal, version):
+        return version_file(os.path.join(self.folder, animal), version)
+
+    @staticmethod
+    def manifest(filepath):
+        """Manifest of the animal folder of a version file"""
+        return MANIFESTS.get(os.path.dirname(filepath))
+
+    def next_version(self, animal):
+        """Name of the next version of animal, e.g. 'v3' if v0 to v2 exist"""
+        animal_folder = os.path.join(self.folder, animal)
+        filenames = os.listdir(animal_folder) if os.path.isdir(animal_folder) else []
+        numbers = [int(match.group(1)) for match in map(_VERSION_FILE.match, filenames) if match]
+        return f"v{max(numbers) + 1 if numbers else 0}"
+
+    # =====================================================
+    # Saving
+    # =====================================================
+
+    def save(self, filepath, state_dict) -> str:
+        """Save the version, returns the path of the written file (always columnar)"""
+        with self._lock:
+            return self._save(filepath, state_dict)
+
+    def _save(self, filepath, state_dict, snapshot=False):
+        version = os.path.splitext(os.path.basename(filepath))[0]
+        previous = version_file(os.path.dirname(filepath), version)
+        filepath = os.path.splitext(filepath)[0] + VERSION_EXTENSIONS[0]
+        if os.path.isfile(previous) and not snapshot:
+            self._detach_dependents(previous)
+        meta = self._meta(filepath, state_dict, snapshot)
+        os.makedirs(os.path.split(filepath)[0], exist_ok=True)
+        tmp_path = filepath + ".tmp"
+        with open(tmp_path, "wb") as f:
+            if meta["kind"] == "snapshot":
+                save_columnar(f, state_dict["graph"], state_dict["node_layout"], meta)
+            else:
+                save_columnar(f, meta=meta)
+        os.replace(tmp_path, filepath)
+        if previous != filepath and os.path.isfile(previous):
+            os.remove(previous)  # Superseded pickle of an older release
+        self.manifest(filepath).record(version, meta, state_dict["graph"], filepath)
+        self._remember(filepath, meta["depth"], state_dict)
+        logger.info(f"Saved {meta['kind']} version to {filepath}")
+        return filepath
+
+    def _detach_dependents(self, filepath):
+        """Rewrite the deltas based on the version at filepath as snapshots, before it is replaced"""
+        version = os.path.splitext(os.path.basename(filepath))[0]
+        for dependent in self.manifest(filepath).dependents(version):
+            path = version_file(os.path.dirname(filepath), dependent)
+            logger.info(f"Version {dependent} is based on {version}, saving it as a snapshot.")
+            self._save(path, self._copy(self._load(path)[1]), snapshot=True)
+
+    def _meta(self, filepath, state_dict, force_snapshot=False):
+        snapshot = {
+            "kind": "snapshot",
+            "depth": 0,
+            "prev_version": state_dict["prev_version"],
+            "prev_path": state_dict["prev_path"],
+        }
+        prev_version = state_dict["prev_version"]
+        base_path = version_file(os.path.dirname(filepath), str(prev_version))
+        if force_snapshot or prev_version in (None, "default") or not os.path.isfile(base_path):
+            return snapshot
+        base_depth, base = self._load(base_path)
+        if base_depth + 1 >= self.snapshot_interval:
+            return snapshot
+
+        meta = dict(snapshot, kind="delta", depth=base_depth + 1, base=prev_version)
+        meta["delta"] = graph_delta(base["graph"], state_dict["graph"]).to_records()
+        meta.update(self._layout_delta(base["node_layout"], state_dict["node_layout"]))
+        try:
+            json.dumps(meta)
+        except (TypeError, ValueError):
+            logger.info("Attributes cannot be stored in a delta, saving a snapshot instead.")
+            return snapshot
+        return meta
+
+    @staticmethod
+    def _positions(layout):
+        return [[node, [float(x) for x in position]] for node, position in layout.items()]
+
+    def _layout_delta(self, base, layout):
+        if base is None or layout is None:
+            return {"node_layout": None if layout is None else self._positions(layout)}
+        changed = {
+            node: position for node, position in layout.items()
+            if node not in base or not np.array_equal(base[node], position)
+        }
+        return {
+            "layout_changes": self._positions(changed),
+            "layout_dropped": [node for node in base if node not in layout],
+        }
+
+    # =====================================================
+    # Loading
+    # =====================================================
+
+    def load(self, filepath):
+        """Full state_dict of the version (graph, node_layout, prev_version, prev_path)"""
+        with self._lock:
+            return self._copy(self._load(filepath)[1])
+
+    def snapshot(self, filepath):
+        """ColumnarGraph of the version if it is stored as a columnar snapshot, None otherwise"""
+        if not filepath.endswith(".npz"):
+            return None
+        columns = ColumnarGraph(filepath)
+        return columns if columns.meta["kind"] == "snapshot" else None
+
+    def _load(self, filepath):
+        """(number of deltas replayed, state_dict), the state_dict must not be edited"""
+        if self._last is not None and self._last[:2] == (filepath, self._stat(filepath)):
+            return self._last[2:]
+
+        if filepath.endswith(".pkl"):
+            entry = self._read_pickle(filepath)
+        else:
+            columns = ColumnarGraph(filepath)
+            entry = dict(columns.meta)
+            if entry["kind"] == "snapshot":
+                entry.update(graph=columns.to_networkx(), node_layout=columns.node_layout())
+            else:
+                entry["delta"] = GraphDelta.from_records(entry["delta"])
+
+        if entry.get("kind", "snapshot") == "snapshot":
+            depth, graph, node_layout = 0, entry["graph"], entry["node_layout"]
+        else:
+            base_depth, base = self._load(version_file(os.path.dirname(filepath), entry["base"]))
+            depth = base_depth + 1
+            graph = entry["delta"].apply(base["graph"].copy())
+            node_layout = self._replay_layout(base["node_layout"], entry)
+        state_dict = {
+            "graph": graph,
+            "node_layout": node_layout,
+            "prev_version": entry["prev_version"],
+            "prev_path": entry["prev_path"],
+        }
+        self._last = (filepath, self._stat(filepath), depth, state_dict)
+        return depth, state_dict
+
+    @staticmethod
+    def _read_pickle(filepath):
+        with open(filepath, "rb") as f:
+            return pickle.load(f)
+
+    @staticmethod
+    def _replay_layout(base, entry):
+        if "node_layout" in entry:
+            layout = entry["node_layout"]
+            if layout is None or isinstance(layout, dict):
+                return layout
+            return {node: np.array(position) for node, position in layout}
+        dropped = set(entry["layout_dropped"])
+        layout = {node: position for node, position in base.items() if node not in dropped}
+        changes = entry["layout_changes"]
+        layout.update(changes.items() if isinstance(changes, dict) else
+                      ((node, np.array(position)) for node, position in changes))
+        return layout
+
+    def _remember(self, filepath, depth, state_dict):
+        self._last = (filepath, self._stat(filepath), depth, self._copy(state_dict))
+
+    @staticmethod
+    def _stat(filepath):
+        stat = os.stat(filepath)
+        return stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def _copy(state_dict):
+        # Note: callers edit the graph they get, the remembered one must stay untouched
+        state_dict = dict(state_dict)
+        state_dict["graph"] = state_dict["graph"].copy()
+        if state_dict.get("node_layout") is not None:
+            state_dict["node_layout"] = dict(state_dict["node_layout"])
+        return state_dict
+
+
+VERSION_STORE = VersionStore()